@@ -1,12 +1,22 @@
+from copy import copy
 from datetime import timedelta
-from copy import deepcopy
+from functools import partial
+import multiprocessing
 import os
+import signal
 
-import staffjoy
+import numpy as np
 
-from mobius.helpers import dt_overlaps, week_day_range, dt_to_day
+from mobius.helpers import week_day_range
+from mobius.incidence import Incidence
 from mobius.constants import MINUTES_PER_HOUR
+from mobius.solver import get_solver, BINARY, INTEGER, LESS_EQUAL, EQUAL, \
+    GREATER_EQUAL
 from mobius import logger, config
+from mobius.client import get_role, get_shift, patch
+from mobius.concurrency import run_concurrently
+from mobius.metrics import Metrics
+from mobius.profiling import BuildProfiler
 
 tune_file = os.path.dirname(os.path.realpath(
     __file__)) + "/../" + config.TUNE_FILE
@@ -15,13 +25,41 @@ tune_file = os.path.dirname(os.path.realpath(
 class Assign():
     """Assigns workers to shifts"""
 
+    # Staged requirements, strictest first - (description,
+    # consecutive_days_off, happiness_scoring)
+    STAGES = [
+        # Step 1: Try consecutive days off, happy
+        ("consecutive days off with happiness", True, True),
+        # Step 2: Try no happy, yes consecutive days off
+        ("consecutive days off without happiness", True, False),
+        # Step 3: Try no happy, no consecutive days off
+        ("no consecutive days off without happiness", False, False),
+    ]
+
     # core math
 
-    def __init__(self, environment, employees, shifts):
+    def __init__(self,
+                 environment,
+                 employees,
+                 shifts,
+                 solver=None,
+                 role=None,
+                 metrics=None,
+                 component=None):
         self.environment = environment
+        self.component = component  # Index, when part of a larger problem
+        self.role = role  # staffjoy role to write back to
+        self.metrics = metrics or Metrics()
+        self.profiler = BuildProfiler(config.PROFILE_MODEL_BUILD)
+        self.solver = solver or config.SOLVER
         self.employees = employees
         self.shifts = shifts
         self.shifts.sort(key=lambda s: s.start)
+        self.incidence = None
+
+        # Linearize pairs of days off (the quadratic form is only kept to
+        # benchmark against)
+        self.linear_days_off = True
 
         logger.info(
             "Initialized assignment problem of %s employees and %s shifts" %
@@ -29,274 +67,614 @@ class Assign():
 
     def set_shift_user_ids(self):
         """Patch request the user ids in for all of the assigned shifts!"""
-        c = staffjoy.Client(key=config.STAFFJOY_API_KEY, env=config.ENV)
-        org = c.get_organization(self.environment.organization_id)
-        loc = org.get_location(self.environment.location_id)
-        role = loc.get_role(self.environment.role_id)
+        role = self.role or get_role(self.environment)
 
+        changed = []
         for shift in self.shifts:
             if shift.user_id is 0:
                 logger.info("Shift %s not assigned" % shift.shift_id)
-            else:
-                logger.info("Setting shift %s to user %s" %
+            elif shift.user_id == shift.original_user_id:
+                logger.info("Shift %s already set to user %s" %
                             (shift.shift_id, shift.user_id))
-                shift_api = role.get_shift(shift.shift_id)
-                shift_api.patch(user_id=shift.user_id)
+            else:
+                changed.append(shift)
+
+        # No bulk endpoint, so patch concurrently
+        with self.metrics.timer("write_back"):
+            run_concurrently([partial(self._patch_shift, role, shift)
+                              for shift in changed])
+        self.metrics.set("shifts_written", len(changed))
+
+    def _patch_shift(self, role, shift):
+        logger.info("Setting shift %s to user %s" %
+                    (shift.shift_id, shift.user_id))
+        patch(get_shift(role, shift.shift_id), user_id=shift.user_id)
+        shift.original_user_id = shift.user_id
+
+    def _shift_cliques(self):
+        """Return maximal groups of shifts that one worker can work at most
+        one of.
+
+        Padding each shift's stop by the minimum time between shifts makes
+        conflicts an interval graph, so the maximal cliques fall out of a
+        single sweep over the sorted start and stop times. A clique is
+        recorded whenever a shift leaves the active set after at least one
+        shift joined it. Cliques of one shift are dropped.
+        """
+        buffer = timedelta(minutes=self.environment.min_minutes_between_shifts)
+
+        # Events are (time, kind, index). Stops sort before starts at the
+        # same time because the padded intervals are half-open.
+        STOP, START = 0, 1
+        events = []
+        for i, s in enumerate(self.shifts):
+            padded_stop = s.stop + buffer
+            if padded_stop <= s.start:
+                # Empty interval - conflicts with nothing
+                continue
+            events.append((s.start, START, i))
+            events.append((padded_stop, STOP, i))
+        events.sort()
+
+        cliques = []
+        active = []
+        grown = False
+        for (_, kind, i) in events:
+            if kind == START:
+                active.append(i)
+                grown = True
+            else:
+                if grown and len(active) > 1:
+                    cliques.append([self.shifts[j] for j in sorted(active)])
+                grown = False
+                active.remove(i)
+
+        return cliques
+
+    def components(self):
+        """Split the problem into parts that share no constraints.
+
+        Every constraint is about one worker or one shift, so connected
+        components of the graph of which worker can work which shift are
+        independent. Returns [(employees, shifts)], largest first. Workers
+        without any available shifts and shifts nobody can work are left
+        out - they could only ever be unassigned.
+        """
+        available = self._build_incidence().available
+
+        components = []
+        unvisited = available.any(axis=1)
+        while unvisited.any():
+            employees = np.zeros(len(self.employees), dtype=bool)
+            employees[np.flatnonzero(unvisited)[0]] = True
+
+            # Grow through shared shifts until nothing new is reachable
+            while True:
+                shifts = available[employees].any(axis=0)
+                reached = available[:, shifts].any(axis=1)
+                if (reached == employees).all():
+                    break
+                employees = reached
+
+            unvisited &= ~employees
+            components.append(([self.employees[
+                i] for i in np.flatnonzero(employees)], [self.shifts[
+                    j] for j in np.flatnonzero(shifts)]))
+
+        components.sort(key=lambda c: len(c[1]), reverse=True)
+        return components
+
+    def calculate(self, decompose=None):
+        """Assign the shifts. Unless decompose (default config.DECOMPOSE)
+        is off, independent components are calculated separately - in
+        parallel when there are several."""
+        if decompose is None:
+            decompose = config.DECOMPOSE
+
+        if decompose:
+            components = self.components()
+            if len(components) > 1:
+                self._calculate_components(components)
+                return
+
+        self._calculate_model()
+
+    def _calculate_components(self, components):
+        """Calculate each component in its own Assign and merge the results.
+
+        Every component falls back through the stages on its own, and the
+        loosest stage any of them needed is reported.
+        """
+        logger.info("Split into %s components (largest has %s shifts)" %
+                    (len(components), len(components[0][1])))
+        self.metrics.set("components", len(components))
+
+        # Solvers run in other processes, which can't use the api - and
+        # the staffjoy role isn't needed once employees are loaded
+        jobs = []
+        for component, (employees, shifts) in enumerate(components):
+            employees = [copy(e) for e in employees]
+            for e in employees:
+                e.role = None
+            jobs.append((self.environment, employees, shifts, self.solver,
+                         component))
+
+        processes = min(len(jobs), config.DECOMPOSE_PROCESSES)
+        with self.metrics.timer("solve_components"):
+            if processes > 1:
+                results = self._map_processes(processes, jobs)
+            else:
+                results = [calculate_component(job) for job in jobs]
+
+        user_ids = {}
+        stage = None
+        for component_user_ids, timings, values in results:
+            user_ids.update(component_user_ids)
+            for phase, seconds in timings.items():
+                self.metrics.add_time(phase, seconds)
+            for name in ["variables", "constraints", "nonzeros"]:
+                self.metrics.set(
+                    name, self.metrics.values.get(name, 0) + values[name])
+            stage = loosest_stage(stage, values["stage"])
+        self.metrics.set("stage", stage)
 
-    def calculate(self):
-        success = False
-        # Step 1: Try consecutive days off, happy
-        try:
-            logger.info("Trying consecutive days off with happiness")
-            self._calculate(consecutive_days_off=True, happiness_scoring=True)
-            success = True
-        except Exception as e:
-            success = False
-            logger.info("Consecutive days off failed: %s" % e)
-
-        if success:
-            return
+        for s in self.shifts:
+            if s.shift_id in user_ids:
+                s.user_id = user_ids[s.shift_id]
 
-        # Step 2: Try no happy, yes consecutive days off
+        logger.info("%s shifts of %s still unsassigned" %
+                    (len([s for s in self.shifts if s.user_id == 0]),
+                     len(self.shifts)))
+
+    def _map_processes(self, processes, jobs):
+        # Solver libraries aren't fork safe, so spawn where possible. Fresh
+        # processes get the config as it is now, and split the threads.
+        context = multiprocessing
+        if hasattr(multiprocessing, "get_context"):
+            context = multiprocessing.get_context("spawn")
+
+        settings = dict((name, getattr(config, name)) for name in dir(config)
+                        if name.isupper())
+        settings["THREADS"] = max(1, config.THREADS // processes)
+
+        pool = context.Pool(processes,
+                            initializer=_configure_process,
+                            initargs=(settings, ))
         try:
-            logger.info("Trying consecutive days off without happiness")
-            self._calculate(consecutive_days_off=True, happiness_scoring=False)
-            success = True
-        except Exception as e:
-            success = False
-            logger.info("Consecutive days off without happiness failed: %s" %
-                        e)
-
-        if success:
+            results = pool.map(calculate_component, jobs, chunksize=1)
+        except BaseException:
+            pool.terminate()
+            pool.join()
+            raise
+
+        pool.close()
+        pool.join()
+        return results
+
+    def _calculate_model(self):
+        """Solve with the strictest requirements that are feasible.
+
+        The model is built once. Each fallback stage only changes the
+        objective and relaxes the consecutive days off constraint, and
+        the incumbent of a failed stage is the MIP start of the next one.
+        """
+        self._build_model()
+
+        if config.SOFT_CONSTRAINTS:
+            # One solve - consecutive days off and happiness are weighed
+            # in the objective instead of being staged
+            logger.info("Trying soft consecutive days off and happiness")
+            self._set_stage(soft=True)
+            self._solve(accept_incumbent=True)
+            self.metrics.set("stage", "soft")
             return
 
-        # Step 3: Try no happy, no consecutive days off
-        # Don't catch error
-        logger.info("Trying consecutive days off without happiness")
-        self._calculate(consecutive_days_off=False, happiness_scoring=False)
+        for stage, (description, consecutive_days_off,
+                    happiness_scoring) in enumerate(self.STAGES):
+            final_stage = stage == len(self.STAGES) - 1
+
+            logger.info("Trying %s" % description)
+            self._set_stage(consecutive_days_off=consecutive_days_off,
+                            happiness_scoring=happiness_scoring)
+            try:
+                self._solve()
+                self.metrics.set("stage", stage_name(description))
+                return
+            except Exception as e:
+                if final_stage:
+                    # Don't catch error
+                    raise
+                logger.info("Trying %s failed: %s" % (description, e))
+
+                # Start the next stage from whatever we found
+                if self.model.warm_start():
+                    logger.info("Warm starting from previous incumbent")
 
     def _calculate(self,
                    consecutive_days_off=False,
                    return_unsolved_model_for_tuning=False,
                    happiness_scoring=False):
-        """Run the calculation"""
+        """Build and run a single stage of the calculation"""
+        self._build_model(tuning=return_unsolved_model_for_tuning)
+        self._set_stage(consecutive_days_off=consecutive_days_off,
+                        happiness_scoring=happiness_scoring)
 
-        # Import Guorbi now so server connection doesn't go stale
-        # (importing triggers a server connection)
-        import gurobipy as grb
-        GRB = grb.GRB  # For easier constant access
+        if return_unsolved_model_for_tuning:
+            return self.model.model
 
-        m = grb.Model("mobius-%s-role-%s" %
-                      (config.ENV, self.environment.role_id))
-        m.setParam("OutputFlag", False)  # Don't print gurobi logs
-        m.setParam("Threads", config.THREADS)
+        self._solve()
 
-        # Add Timeout on happiness scoring.
-        if happiness_scoring:
-            m.setParam("TimeLimit", config.HAPPY_CALCULATION_TIMEOUT)
+    def _build_model(self, tuning=False):
+        """Build the model with every staged requirement included"""
+        m = get_solver("mobius-%s-role-%s" %
+                       (config.ENV, self.environment.role_id),
+                       solver=self.solver)
+        self.model = m
 
         # Try loading a tuning file if we're not tuning
-        if not return_unsolved_model_for_tuning:
-            try:
-                m.read(tune_file)
+        if not tuning:
+            if m.load_tuning(tune_file):
                 logger.info("Loaded tuned model")
-            except:
+            else:
                 logger.info("No tune file found")
 
-        # Create objective - which is basically happiness minus penalties
-        obj = grb.LinExpr()
-
-        # Whether worker is assigned to shift
-        assignments = {}
-        unassigned = {}
-        for e in self.employees:
+        self._build_incidence()
+
+        # Create objective - which is basically happiness minus penalties.
+        # Happiness is kept separate so stages can leave it out.
+        self.penalties = m.expression()
+        self.happiness = m.expression()
+
+        for family, add in [
+            ("assignment_variables", self._add_assignment_variables),
+            ("helper_variables", self._add_helper_variables),
+            ("coverage", self._add_coverage_constraints),
+            ("transitions", self._add_transition_constraints),
+            ("consecutive_days_off",
+             self._add_consecutive_days_off_constraints),
+            ("day_sums", self._add_day_constraints),
+            ("week", self._add_week_constraints),
+            ("workday", self._add_workday_constraints),
+        ]:
+            with self.metrics.timer("build_%s" % family), \
+                    self.profiler.section(family):
+                add()
+                m.update()
+
+        if self.profiler.enabled:
+            logger.info("Model build profile:\n%s" % self.profiler.summary())
+            name = "mobius-%s-role-%s-%s" % (config.ENV,
+                                             self.environment.role_id,
+                                             self.environment.schedule_id)
+            if self.component is not None:
+                # Components are built in parallel
+                name += "-component-%s" % self.component
+            self.profiler.dump(config.PROFILE_DIR, name)
+
+        variables, constraints, nonzeros = m.size()
+        self.metrics.set("variables", variables)
+        self.metrics.set("constraints", constraints)
+        self.metrics.set("nonzeros", nonzeros)
+
+    def _build_incidence(self):
+        """Shift/day/workday/availability relationships as arrays - built
+        once, whether for splitting into components or for the model"""
+        if self.incidence is None:
+            with self.metrics.timer("build_incidence"), \
+                    self.profiler.section("incidence"):
+                self.incidence = Incidence(self.environment, self.employees,
+                                           self.shifts)
+        return self.incidence
+
+    def _add_assignment_variables(self):
+        m = self.model
+        incidence = self.incidence
+
+        # Whether worker is assigned to shift. Variables only exist for
+        # shifts the worker is available to work.
+        self.assignments = {}
+        self.unassigned = {}
+        # Same variables, as {shift index: variable} per employee index
+        self.assignment_rows = []
+        # .. and as a list of variables per shift index
+        self.shift_assignments = [[] for s in self.shifts]
+        # Most happiness each worker could get, to weigh soft constraints
+        self.max_happiness = {}
+        for i, e in enumerate(self.employees):
             logger.debug("Building shifts for user %s" % e.user_id)
-            for s in self.shifts:
-                assignments[e.user_id, s.shift_id] = m.addVar(
-                    vtype=GRB.BINARY,
-                    name="user-%s-assigned-shift-%s" % (e.user_id, s.shift_id))
-
-                # Only add happiness if we're scoring happiness
-                if happiness_scoring:
-                    obj += assignments[e.user_id,
-                                       s.shift_id] * e.shift_happiness_score(s)
-
-                # Also add an unassigned shift - and penalize it!
-                unassigned[s.shift_id] = m.addVar(vtype=GRB.BINARY,
-                                                  name="unassigned-shift-%s" %
-                                                  s.shift_id)
-                obj += unassigned[s.shift_id] * config.UNASSIGNED_PENALTY
-
-        # Helper variables
-        min_week_hours_violation = {}
-        week_minutes_sum = {}
-        day_shifts_sum = {}
-        day_active = {}
+            row = {}
+            self.max_happiness[e.user_id] = 0
+            for j in np.flatnonzero(incidence.available[i]):
+                s = self.shifts[j]
+                self.assignments[e.user_id, s.shift_id] = m.add_var(
+                    "user-%s-assigned-shift-%s" % (e.user_id, s.shift_id),
+                    vtype=BINARY)
+                row[j] = self.assignments[e.user_id, s.shift_id]
+                self.shift_assignments[j].append(row[j])
+
+                score = e.shift_happiness_score(s)
+                self.happiness += row[j] * score
+                self.max_happiness[e.user_id] += max(score, 0)
+
+            self.assignment_rows.append(row)
+
+        # Availability is enforced by only creating variables for
+        # available shifts (above)
+        logger.debug("Skipped %s unavailable assignments of %s" %
+                     ((~incidence.available).sum(), incidence.available.size))
+
+        # Also add an unassigned shift - and penalize it!
+        for s in self.shifts:
+            self.unassigned[s.shift_id] = m.add_var("unassigned-shift-%s" %
+                                                    s.shift_id,
+                                                    vtype=BINARY)
+            self.penalties += self.unassigned[
+                s.shift_id] * config.UNASSIGNED_PENALTY
+
+    def _add_helper_variables(self):
+        m = self.model
+
+        self.min_week_hours_violation = {}
+        self.week_minutes_sum = {}
+        self.day_shifts_sum = {}
+        # Whether the worker has no shifts on a day
+        self.day_off = {}
         for e in self.employees:
-            min_week_hours_violation[e.user_id] = m.addVar(
-                vtype=GRB.BINARY,
-                name="user-%s-min-week-hours-violation" % (e.user_id))
+            self.min_week_hours_violation[e.user_id] = m.add_var(
+                "user-%s-min-week-hours-violation" % (e.user_id),
+                vtype=BINARY)
 
-            week_minutes_sum[e.user_id] = m.addVar(
-                name="user-%s-hours-per-week" % e.user_id)
+            self.week_minutes_sum[e.user_id] = m.add_var(
+                "user-%s-hours-per-week" % e.user_id)
 
             for day in week_day_range():
-                day_shifts_sum[e.user_id, day] = m.addVar(
-                    vtype=GRB.INTEGER,
-                    name="user-%s-day-%s-shift-sum" % (e.user_id, day))
+                self.day_shifts_sum[e.user_id, day] = m.add_var(
+                    "user-%s-day-%s-shift-sum" % (e.user_id, day),
+                    vtype=INTEGER)
 
-                day_active[e.user_id, day] = m.addVar(
-                    vtype=GRB.BINARY,
-                    name="user-%s-day-%s-shift-sum" % (e.user_id, day))
+                self.day_off[e.user_id, day] = m.add_var("user-%s-day-%s-off" %
+                                                         (e.user_id, day),
+                                                         vtype=BINARY)
 
-            obj += min_week_hours_violation[
+            self.penalties += self.min_week_hours_violation[
                 e.user_id] * config.MIN_HOURS_VIOLATION_PENALTY
 
-        m.update()
-
-        for s in self.shifts:
-            m.addConstr(
-                grb.quicksum(assignments[e.user_id, s.shift_id]
-                             for e in self.employees) + unassigned[s.shift_id],
-                GRB.EQUAL, 1)
-
-        # Allowed shift state transitions
-        for test in self.shifts:
-            # Use index because shifts are sorted!
-            # Iterate through "other" (o) shifts
-            for o in self.shifts:
-                if o.shift_id == test.shift_id:
-                    continue
-
-                # Add min minutes between shifts for allowed overlaps
-                if dt_overlaps(
-                        o.start,
-                        o.stop,
-                        test.start,
-                        test.stop + timedelta(minutes=self.environment.
-                                              min_minutes_between_shifts)):
-
-                    # Add constraint that shift transitions not allowed
-                    for e in self.employees:
-                        m.addConstr(assignments[e.user_id, test.shift_id] +
-                                    assignments[e.user_id, o.shift_id],
-                                    GRB.LESS_EQUAL, 1)
-
+    def _add_coverage_constraints(self):
+        m = self.model
+        for j, s in enumerate(self.shifts):
+            m.add_constr(
+                m.quicksum(self.shift_assignments[j]) +
+                self.unassigned[s.shift_id], EQUAL, 1)
+
+    def _add_transition_constraints(self):
+        # Allowed shift state transitions - a worker can work at most
+        # one shift of each group of mutually conflicting shifts
+        m = self.model
+        for clique in self._shift_cliques():
+            for e in self.employees:
+                clique_assignments = [
+                    self.assignments[e.user_id, s.shift_id] for s in clique
+                    if (e.user_id, s.shift_id) in self.assignments
+                ]
+                if len(clique_assignments) > 1:
+                    m.add_constr(m.quicksum(clique_assignments), LESS_EQUAL, 1)
+
+    def _add_consecutive_days_off_constraints(self):
         # Add consecutive days off constraint
         # so that workers have a "weekend" - at least 2 consecutive
         # days off in a week where possible
-        # 
-        # The current  implementation has us run the model a second
-        # time if this is infeasible, however we should revise it
-        # to be a weighted variable.
-        if consecutive_days_off:
-            for e in self.employees:
-                day_off_sum = grb.LinExpr()
-                previous_day_name = None
-                for day in week_day_range(self.environment.day_week_starts):
-                    if not previous_day_name:
-                        # It's the first loop
-                        if not e.preceding_day_worked:
-                            # if they didn't work the day before, then not
-                            # working the first day is consec days off
-                            day_off_sum += (1 - day_active[e.user_id, day])
-                    else:
-                        # We're in the loop not on first day
-                        day_off_sum += (1 - day_active[e.user_id, day]) * (
-                            1 - day_active[e.user_id, previous_day_name])
-
-                    previous_day_name = day
-
-                # We now have built the LinExpr. It needs to be >= 1
-                # (for at least 1 set of consec days off)
-                m.addConstr(day_off_sum, GRB.GREATER_EQUAL, 1)
-
-        # Availability constraints
+        #
+        # Each employee's constraint can be relaxed by a violation variable.
+        # Stages that require consecutive days off fix them to zero, and
+        # the soft constraint mode penalizes them instead.
+        m = self.model
+        day_off = self.day_off
+        self.days_off_violation = {}
         for e in self.employees:
-            for s in self.shifts:
-                if not e.available_to_work(s):
-                    logger.debug("User %s unavailable to work shift %s" %
-                                 (e.user_id, s.shift_id))
-                    m.addConstr(assignments[e.user_id, s.shift_id], GRB.EQUAL,
-                                0)
+            self.days_off_violation[e.user_id] = m.add_var(
+                "user-%s-consecutive-days-off-violation" % e.user_id,
+                vtype=BINARY)
+        m.update()
 
-        # Limit employee hours per workweek
         for e in self.employees:
+            day_off_sum = m.expression()
+            previous_day_name = None
+            for day in week_day_range(self.environment.day_week_starts):
+                if not previous_day_name:
+                    # It's the first loop
+                    if not e.preceding_day_worked:
+                        # if they didn't work the day before, then not
+                        # working the first day is consec days off
+                        day_off_sum += day_off[e.user_id, day]
+                elif self.linear_days_off:
+                    # We're in the loop not on first day. Both days off is
+                    # the product of the day off binaries - linearized by a
+                    # binary that can only be 1 if both days are off. (It
+                    # only needs to be bounded above, because the sum is
+                    # bounded below.)
+                    both_off = m.add_var("user-%s-days-off-%s-%s" %
+                                         (e.user_id, previous_day_name, day),
+                                         vtype=BINARY)
+                    m.add_constr(both_off, LESS_EQUAL, day_off[e.user_id, day])
+                    m.add_constr(both_off, LESS_EQUAL,
+                                 day_off[e.user_id, previous_day_name])
+                    day_off_sum += both_off
+                else:
+                    # Quadratic product, only kept for benchmarking
+                    day_off_sum += day_off[e.user_id, day] * day_off[
+                        e.user_id, previous_day_name]
+
+                previous_day_name = day
+
+            # We now have built the LinExpr. It needs to be >= 1
+            # (for at least 1 set of consec days off)
+            m.add_constr(day_off_sum + self.days_off_violation[e.user_id],
+                         GREATER_EQUAL, 1)
+
+    def _add_day_constraints(self):
+        m = self.model
+        incidence = self.incidence
+
+        # Sum each employee's shifts per day, and flag the days off
+        for i, e in enumerate(self.employees):
+            row = self.assignment_rows[i]
+
+            for d, day in enumerate(incidence.days):
+                day_shifts_sum = self.day_shifts_sum[e.user_id, day]
+                day_off = self.day_off[e.user_id, day]
+                day_assignments = [
+                    row[j]
+                    for j in np.flatnonzero(incidence.available[i] &
+                                            incidence.day[:, d])
+                ]
+                m.add_constr(day_shifts_sum, EQUAL,
+                             m.quicksum(day_assignments))
+
+                # At most one of the shift sum and day off flag is nonzero.
+                # (Linear form of an SOS1 constraint, so that every backend
+                # supports it - the shift sum never exceeds the number of
+                # shifts that day.)
+                m.add_constr(day_shifts_sum, LESS_EQUAL,
+                             len(day_assignments) * (1 - day_off))
+
+                m.add_constr(day_shifts_sum + day_off, GREATER_EQUAL, 1)
+
+    def _add_week_constraints(self):
+        m = self.model
+        incidence = self.incidence
+
+        # Limit employee hours per workweek
+        for i, e in enumerate(self.employees):
+            row = self.assignment_rows[i]
+            indexes = np.flatnonzero(incidence.available[i])
+            week_minutes_sum = self.week_minutes_sum[e.user_id]
 
             # The running total of shifts is equal to the helper variable
-            m.addConstr(
-                sum([s.total_minutes() * assignments[e.user_id, s.shift_id]
-                     for s in self.shifts]), GRB.EQUAL,
-                week_minutes_sum[e.user_id])
+            m.add_constr(
+                m.linear_expression(incidence.minutes[indexes].tolist(),
+                                    [row[j] for j in indexes]), EQUAL,
+                week_minutes_sum)
 
             # The total minutes an employee works in a week is less than or equal to their max
-            m.addConstr(week_minutes_sum[e.user_id], GRB.LESS_EQUAL,
-                        e.max_hours_per_workweek * MINUTES_PER_HOUR)
+            m.add_constr(week_minutes_sum, LESS_EQUAL,
+                         e.max_hours_per_workweek * MINUTES_PER_HOUR)
 
             # A worker must work at least their min hours per week. 
             # Violation causes a penalty.
             # NOTE - once the min is violated, we don't say "try to get as close as possible" - 
             # we stop unassigned shifts, but if you violate min then you're not guaranteed anything
-            m.addConstr(week_minutes_sum[e.user_id], GRB.GREATER_EQUAL,
-                        e.min_hours_per_workweek * MINUTES_PER_HOUR *
-                        (1 - min_week_hours_violation[e.user_id]))
+            m.add_constr(week_minutes_sum, GREATER_EQUAL,
+                         e.min_hours_per_workweek * MINUTES_PER_HOUR *
+                         (1 - self.min_week_hours_violation[e.user_id]))
 
-            for day in week_day_range():
-                m.addSOS(GRB.SOS_TYPE1, [day_shifts_sum[e.user_id, day],
-                                         day_active[e.user_id, day]])
-                m.addConstr(day_shifts_sum[e.user_id, day], GRB.EQUAL,
-                            grb.quicksum([assignments[e.user_id, s.shift_id]
-                                          for s in self.shifts
-                                          if ((dt_to_day(s.start) == day) or (
-                                              dt_to_day(s.stop) == day and
-                                              s.stop <= self.environment.stop))
-                                          ]))
-
-                m.addConstr(day_shifts_sum[e.user_id, day] +
-                            day_active[e.user_id, day], GRB.GREATER_EQUAL, 1)
+    def _add_workday_constraints(self):
+        m = self.model
+        incidence = self.incidence
 
         # Limit employee hours per workday
-        workday_start = deepcopy(self.environment.start)
-        while workday_start < self.environment.stop:
-            for e in self.employees:
-                # Look for minutes of overlap
-                workday_stop = workday_start + timedelta(days=1)
-                m.addConstr(
-                    sum([s.minutes_overlap(start=workday_start,
-                                           stop=workday_stop) * assignments[
-                                               e.user_id, s.shift_id]
-                         for s in self.shifts
-                         if dt_overlaps(s.start, s.stop, workday_start,
-                                        workday_stop)]),
-                    GRB.LESS_EQUAL,
+        for workday in range(incidence.workday_minutes.shape[1]):
+            # Minutes of overlap with the workday
+            minutes = incidence.workday_minutes[:, workday]
+            for i, row in enumerate(self.assignment_rows):
+                indexes = np.flatnonzero(incidence.available[i] & (minutes > 0
+                                                                   ))
+                if len(indexes) == 0:
+                    continue
+                m.add_constr(
+                    m.linear_expression(minutes[indexes].tolist(),
+                                        [row[j] for j in indexes]), LESS_EQUAL,
                     self.environment.max_minutes_per_workday)
 
-            workday_start += timedelta(days=1)
-
+    def _set_stage(self,
+                   consecutive_days_off=False,
+                   happiness_scoring=False,
+                   soft=False):
+        """Toggle the staged requirements on the built model.
+
+        With soft set, consecutive days off violations are penalized and
+        happiness is scored, so that a single solve covers every stage.
+        """
+        m = self.model
+
+        objective = self.penalties
+        if consecutive_days_off and not soft:
+            upper = 0
+        else:
+            upper = 1
+
+        for i, e in enumerate(self.employees):
+            violation = self.days_off_violation[e.user_id]
+            m.set_bounds(violation, 0, upper)
+            if soft:
+                objective = objective + violation * \
+                    self._days_off_violation_penalty(i, e)
+
+        # Only add happiness if we're scoring happiness
+        if happiness_scoring or soft:
+            # Add Timeout on happiness scoring.
+            m.set_time_limit(config.HAPPY_CALCULATION_TIMEOUT)
+            objective = objective + self.happiness * config.HAPPINESS_WEIGHT
+        else:
+            m.set_time_limit(None)
+
+        m.set_objective(objective, maximize=True)
         m.update()
-        m.setObjective(obj)
-        m.modelSense = GRB.MAXIMIZE  # Make something people love!
-
-        if return_unsolved_model_for_tuning:
-            return m
 
-        m.optimize()
-        if m.status != GRB.status.OPTIMAL:
-            logger.info("Calculation failed - gurobi status code %s" %
-                        m.status)
-            raise Exception("Calculation failed")
+    def _days_off_violation_penalty(self, i, e):
+        """Soft mode penalty for worker e (index i) going without
+        consecutive days off. By default it is more than working through
+        could ever gain, so days off come before coverage like in the
+        stages."""
+        if config.CONSECUTIVE_DAYS_OFF_VIOLATION_PENALTY is not None:
+            return config.CONSECUTIVE_DAYS_OFF_VIOLATION_PENALTY
+
+        gain = (abs(config.UNASSIGNED_PENALTY) * len(self.assignment_rows[i]) +
+                abs(config.MIN_HOURS_VIOLATION_PENALTY) +
+                abs(config.HAPPINESS_WEIGHT) * self.max_happiness[e.user_id])
+        return -(gain + 1)
+
+    def _solve(self, accept_incumbent=False):
+        """Optimize the model and set user ids on the assigned shifts.
+
+        If accept_incumbent is set, the best solution found before the
+        solver stopped (e.g. at the time limit) is used when it is not
+        proven optimal.
+        """
+        m = self.model
+
+        with self.metrics.timer("solve"):
+            optimal = m.optimize()
+        self.metrics.set("solver_status", str(m.status()))
+
+        if not optimal:
+            if accept_incumbent and m.has_solution():
+                logger.info("Using best solution found - solver status %s" %
+                            m.status())
+            else:
+                logger.info("Calculation failed - solver status %s" %
+                            m.status())
+                raise Exception("Calculation failed")
 
-        logger.info("Optimized! objective: %s" % m.objVal)
+        logger.info("Optimized! objective: %s" % m.objective_value())
+        self.metrics.set("objective", m.objective_value())
+        if m.gap() is not None:
+            self.metrics.set("gap", m.gap())
 
         for e in self.employees:
-            if min_week_hours_violation[e.user_id].x > .5:
+            if m.value(self.days_off_violation[e.user_id]) > .5:
+                logger.info("User %s has no consecutive days off" % e.user_id)
+
+            if m.value(self.min_week_hours_violation[e.user_id]) > .5:
                 logger.info(
                     "User %s unable to meet min hours for week (hours: %s, min: %s)"
-                    % (e.user_id, 1.0 * week_minutes_sum[e.user_id].x /
+                    % (e.user_id,
+                       1.0 * m.value(self.week_minutes_sum[e.user_id]) /
                        MINUTES_PER_HOUR, e.min_hours_per_workweek))
 
             for s in self.shifts:
-                if assignments[e.user_id, s.shift_id].x > .5:
+                if (e.user_id, s.shift_id) not in self.assignments:
+                    continue
+                if m.value(self.assignments[e.user_id, s.shift_id]) > .5:
                     logger.info("User %s assigned shift %s" %
                                 (e.user_id, s.shift_id))
                     s.user_id = e.user_id
@@ -304,3 +682,39 @@ class Assign():
         logger.info("%s shifts of %s still unsassigned" %
                     (len([s for s in self.shifts if s.user_id == 0]),
                      len(self.shifts)))
+
+
+def stage_name(description):
+    """Metric label of a stage"""
+    return description.replace(" ", "_")
+
+
+def loosest_stage(a, b):
+    """The more relaxed of two stage names (either may be None)"""
+    order = [None] + [stage_name(d) for d, _, _ in Assign.STAGES] + ["soft"]
+    return max(a, b, key=order.index)
+
+
+def _configure_process(settings):
+    # Supervised workers ignore these, and children inherit that - which
+    # would keep Pool.terminate() from stopping them
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    for name, value in settings.items():
+        setattr(config, name, value)
+
+
+def calculate_component(job):
+    """Calculate one component of a problem. Returns ({shift id: user id},
+    timings, metric values) - run in a process pool, so everything is
+    picklable."""
+    environment, employees, shifts, solver, component = job
+    a = Assign(environment,
+               employees,
+               list(shifts),
+               solver=solver,
+               component=component)
+    a.calculate(decompose=False)
+    user_ids = dict((s.shift_id, s.user_id) for s in a.shifts if s.user_id)
+    return user_ids, dict(a.metrics.timings), dict(a.metrics.values)
@@ -0,0 +1,14 @@
+"""
+Benchmarks of Assign on synthetic roles.
+
+Scenarios are generated offline (no api), so the suite runs anywhere with an
+open-source solver. Run a scaling grid with:
+
+    python -m mobius.benchmark --grid small --solve --output results.json
+
+Results are JSON - model size, build time (overall and per constraint
+family), solve time and peak memory for each scenario.
+"""
+
+from .scenario import Scenario
+from .runner import GRIDS, grid, measure, run
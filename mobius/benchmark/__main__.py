@@ -0,0 +1,56 @@
+import argparse
+import json
+import logging
+import sys
+
+from mobius import logger
+from mobius.benchmark.runner import GRIDS, grid, run
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m mobius.benchmark",
+        description="Benchmark Assign on a grid of synthetic roles")
+    parser.add_argument("--grid", choices=sorted(GRIDS), default="small")
+    parser.add_argument("--solver", default="cbc")
+    parser.add_argument("--solve",
+                        action="store_true",
+                        help="Solve too, not just build")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--time-limit",
+                        type=float,
+                        default=30,
+                        help="Seconds per solve")
+    parser.add_argument("--overlap", type=float, default=0.5)
+    parser.add_argument("--availability", type=float, default=0.8)
+    parser.add_argument("--time-off-rate", type=float, default=0.1)
+    parser.add_argument("--timezone", default="America/Los_Angeles")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON file (default stdout)")
+    args = parser.parse_args(argv)
+
+    # Per shift logs would drown the results
+    logger.setLevel(logging.WARNING)
+
+    scenarios = grid(args.grid,
+                     overlap=args.overlap,
+                     availability=args.availability,
+                     time_off_rate=args.time_off_rate,
+                     tz_string=args.timezone,
+                     seed=args.seed)
+    report = run(scenarios,
+                 solver=args.solver,
+                 solve=args.solve,
+                 repeat=args.repeat,
+                 time_limit=args.time_limit)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Fail when Assign got slower or bigger than a saved benchmark baseline.
+
+    python -m mobius.benchmark.regression --baseline benchmarks/baseline.json
+    python -m mobius.benchmark.regression --baseline ... --update
+
+The check reruns the baseline's scenarios with its settings. Timings are
+compared by median, and only count as a regression when the median is
+max_ratio times the baseline's, the difference is beyond iqr_multiplier
+interquartile ranges of noise, and it is more than min_seconds. Model size
+is deterministic, so it is compared directly.
+"""
+
+import argparse
+import json
+import logging
+import sys
+
+from mobius import config, logger
+from mobius.benchmark.runner import grid, median, run, GRIDS
+from mobius.benchmark.scenario import Scenario
+
+TIMINGS = ["build_seconds", "solve_seconds"]
+SIZES = ["variables", "constraints"]
+
+
+def iqr(samples):
+    """Interquartile range, interpolating between samples"""
+
+    def quantile(ordered, q):
+        position = (len(ordered) - 1) * q
+        lower = int(position)
+        upper = min(lower + 1, len(ordered) - 1)
+        return ordered[lower] + (ordered[upper] - ordered[lower]) * (position -
+                                                                     lower)
+
+    ordered = sorted(samples)
+    return quantile(ordered, 0.75) - quantile(ordered, 0.25)
+
+
+def compare_timing(baseline, current, max_ratio, iqr_multiplier, min_seconds):
+    """Return (baseline median, current median, whether regressed)"""
+    baseline_median = median(baseline)
+    current_median = median(current)
+    noise = iqr_multiplier * max(iqr(baseline), iqr(current))
+    difference = current_median - baseline_median
+
+    regressed = (current_median > baseline_median * max_ratio and
+                 difference > noise and difference > min_seconds)
+    return baseline_median, current_median, regressed
+
+
+def compare(baseline_report,
+            current_report,
+            max_ratio=1.5,
+            max_size_ratio=1.05,
+            iqr_multiplier=2,
+            min_seconds=0.05):
+    """Return a row per scenario and metric - (scenario, metric, baseline,
+    current, regressed)"""
+    current_results = dict((r["scenario"], r)
+                           for r in current_report["results"])
+
+    rows = []
+    for baseline in baseline_report["results"]:
+        current = current_results.get(baseline["scenario"])
+        if current is None:
+            continue
+
+        for metric in TIMINGS:
+            if metric in baseline and metric in current:
+                rows.append((baseline["scenario"], metric) + compare_timing(
+                    baseline[metric], current[
+                        metric], max_ratio, iqr_multiplier, min_seconds))
+
+        for metric in SIZES:
+            rows.append((baseline["scenario"], metric, baseline[
+                metric], current[metric], current[metric] > baseline[metric] *
+                         max_size_ratio))
+
+    return rows
+
+
+def rerun(baseline_report):
+    """Run the baseline's scenarios again with the same settings, including
+    the solver threads it was recorded with"""
+    meta = baseline_report["meta"]
+    scenarios = [Scenario(**r["params"]) for r in baseline_report["results"]]
+
+    previous_threads = config.THREADS
+    config.THREADS = meta.get("threads") or config.THREADS
+    try:
+        return run(scenarios,
+                   solver=meta["solver"],
+                   solve=meta["solve"],
+                   repeat=meta["repeat"],
+                   time_limit=meta["time_limit"])
+    finally:
+        config.THREADS = previous_threads
+
+
+def format_rows(rows):
+    lines = ["%-48s %-16s %12s %12s %8s  %s" %
+             ("scenario", "metric", "baseline", "current", "ratio", "")]
+    for scenario, metric, baseline, current, regressed in rows:
+        ratio = 1.0 * current / baseline if baseline else float("inf")
+        lines.append("%-48s %-16s %12.4g %12.4g %7.2fx  %s" %
+                     (scenario, metric, baseline, current, ratio, "REGRESSED"
+                      if regressed else "ok"))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m mobius.benchmark.regression",
+        description="Compare Assign benchmarks against a saved baseline")
+    parser.add_argument("--baseline", required=True, help="JSON baseline")
+    parser.add_argument("--update",
+                        action="store_true",
+                        help="Write a new baseline instead of checking")
+    parser.add_argument("--grid",
+                        choices=sorted(GRIDS),
+                        default="small",
+                        help="Scenarios for --update")
+    parser.add_argument("--solver", default="cbc")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--time-limit", type=float, default=10)
+    parser.add_argument("--max-ratio", type=float, default=1.5)
+    parser.add_argument("--max-size-ratio", type=float, default=1.05)
+    parser.add_argument("--iqr-multiplier", type=float, default=2)
+    parser.add_argument("--min-seconds", type=float, default=0.05)
+    args = parser.parse_args(argv)
+
+    logger.setLevel(logging.WARNING)
+
+    if args.update:
+        report = run(
+            grid(args.grid),
+            solver=args.solver,
+            solve=True,
+            repeat=args.repeat,
+            time_limit=args.time_limit)
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print("Wrote baseline %s" % args.baseline)
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+
+    rows = compare(baseline,
+                   rerun(baseline),
+                   max_ratio=args.max_ratio,
+                   max_size_ratio=args.max_size_ratio,
+                   iqr_multiplier=args.iqr_multiplier,
+                   min_seconds=args.min_seconds)
+    print(format_rows(rows))
+
+    if not rows:
+        print("No scenarios matched %s - regenerate it with --update" %
+              args.baseline)
+        return 1
+    if any(row[-1] for row in rows):
+        print("Performance regressed against %s" % args.baseline)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
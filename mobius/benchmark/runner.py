@@ -0,0 +1,138 @@
+"""
+Measure building and solving Assign models for synthetic scenarios.
+"""
+
+from collections import OrderedDict
+import platform
+import time
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+from mobius import Assign, config
+from mobius.benchmark.scenario import Scenario
+from mobius.metrics import Metrics
+
+# Scaling grids of (employees, shifts)
+GRIDS = {
+    "tiny": [(3, 10), (5, 20)],
+    "small": [(5, 20), (10, 40), (20, 80)],
+    "large": [(25, 100), (50, 200), (100, 400)],
+}
+
+
+def grid(name, **params):
+    """Return the scenarios of a named grid, with any other Scenario
+    parameters fixed"""
+    return [
+        Scenario(employees=employees,
+                 shifts=shifts, **params) for employees, shifts in GRIDS[name]
+    ]
+
+
+def median(samples):
+    ordered = sorted(samples)
+    middle = len(ordered) // 2
+    if len(ordered) % 2:
+        return ordered[middle]
+    return (ordered[middle - 1] + ordered[middle]) / 2.0
+
+
+def _assign(scenario, solver):
+    environment, employees, shifts = scenario.build()
+    metrics = Metrics()
+    return Assign(environment,
+                  employees,
+                  shifts,
+                  solver=solver,
+                  metrics=metrics), metrics
+
+
+def peak_build_memory(scenario, solver):
+    """Peak bytes allocated while building the model (None on Python 2).
+    Tracing slows building down, so this is a separate build."""
+    if tracemalloc is None:
+        return None
+
+    a, _ = _assign(scenario, solver)
+    tracemalloc.start()
+    try:
+        a._build_model()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure(scenario, solver="cbc", solve=False, repeat=1, time_limit=30):
+    """Build (and optionally solve) a scenario repeat times and return the
+    results as a dict.
+
+    Solving is one soft-constraint stage with a time limit, so it is
+    bounded and comparable between runs.
+    """
+    result = OrderedDict()
+    result["scenario"] = scenario.name()
+    result["params"] = scenario.params()
+    result["build_seconds"] = []
+    if solve:
+        result["solve_seconds"] = []
+    families = {}
+
+    for _ in range(repeat):
+        a, metrics = _assign(scenario, solver)
+
+        start = time.time()
+        a._build_model()
+        result["build_seconds"].append(time.time() - start)
+
+        for phase, seconds in metrics.timings.items():
+            families.setdefault(phase, []).append(seconds)
+
+        if solve:
+            a._set_stage(soft=True)
+            a.model.set_time_limit(time_limit)
+            start = time.time()
+            try:
+                a._solve(accept_incumbent=True)
+            except Exception:
+                # Recorded - nothing found in the time limit
+                pass
+            result["solve_seconds"].append(time.time() - start)
+
+    for name in ["variables", "constraints", "nonzeros"]:
+        result[name] = metrics.values[name]
+
+    result["build_families"] = OrderedDict(
+        (phase, median(samples)) for phase, samples in families.items())
+    result["peak_memory_bytes"] = peak_build_memory(scenario, solver)
+
+    if solve:
+        result["solved"] = a.model.has_solution()
+        result["assigned"] = len([s for s in a.shifts if s.user_id])
+        result["gap"] = metrics.values.get("gap")
+
+    return result
+
+
+def run(scenarios, solver="cbc", solve=False, repeat=1, time_limit=30):
+    """Measure every scenario and return a JSON-able report"""
+    report = OrderedDict()
+    report["meta"] = OrderedDict([
+        ("timestamp", time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())),
+        ("python", platform.python_version()),
+        ("machine", platform.machine()),
+        ("solver", solver),
+        ("solve", solve),
+        ("repeat", repeat),
+        ("time_limit", time_limit),
+        ("threads", config.THREADS),
+    ])
+    report["results"] = [measure(scenario,
+                                 solver=solver,
+                                 solve=solve,
+                                 repeat=repeat,
+                                 time_limit=time_limit)
+                         for scenario in scenarios]
+    return report
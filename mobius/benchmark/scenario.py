@@ -0,0 +1,145 @@
+"""
+Generate synthetic roles to benchmark Assign against.
+
+Everything is injected into Environment, Employee and Shift, so a scenario
+builds without the api. The same parameters and seed always give the same
+scenario.
+"""
+
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import random
+
+from mobius import Environment, Employee
+from mobius.constants import HOURS_PER_DAY
+from mobius.helpers import week_day_range
+from mobius.shift import Shift
+
+WEEK_START = datetime(2015, 12, 21)  # A monday
+DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+
+class Record(object):
+    """Stands in for an api object - Employee reads time off from .data"""
+
+    def __init__(self, data):
+        self.data = data
+
+
+class Scenario(object):
+    """Parameters of a synthetic role.
+
+    * employees - workers in the role
+    * shifts - unassigned shifts in the week
+    * overlap - 0 to 1, how much shifts pile onto the same start times
+    * availability - 0 to 1, chance each worker can work a given day
+    * time_off_rate - chance each worker has a (paid) day off this week
+    * tz_string - timezone of the location
+    """
+
+    def __init__(self,
+                 employees=10,
+                 shifts=40,
+                 overlap=0.5,
+                 availability=0.8,
+                 time_off_rate=0.1,
+                 tz_string="America/Los_Angeles",
+                 seed=0):
+        self.employees = employees
+        self.shifts = shifts
+        self.overlap = overlap
+        self.availability = availability
+        self.time_off_rate = time_off_rate
+        self.tz_string = tz_string
+        self.seed = seed
+
+    def params(self):
+        return OrderedDict([
+            ("employees", self.employees),
+            ("shifts", self.shifts),
+            ("overlap", self.overlap),
+            ("availability", self.availability),
+            ("time_off_rate", self.time_off_rate),
+            ("tz_string", self.tz_string),
+            ("seed", self.seed),
+        ])
+
+    def name(self):
+        """Unique per parameters, so results can be matched by name"""
+        return "e%s-s%s-o%s-a%s-t%s-%s-r%s" % (
+            self.employees, self.shifts, self.overlap, self.availability,
+            self.time_off_rate, self.tz_string, self.seed)
+
+    def build(self):
+        """Return (environment, employees, shifts)"""
+        rng = random.Random(self.seed)
+        environment = Environment(
+            organization_id=1,
+            location_id=1,
+            role_id=1,
+            schedule_id=1,
+            tz_string=self.tz_string,
+            start=WEEK_START.strftime(DATETIME_FORMAT),
+            stop=(WEEK_START + timedelta(days=7)).strftime(DATETIME_FORMAT),
+            day_week_starts="monday",
+            min_minutes_per_workday=60 * 4,
+            max_minutes_per_workday=60 * 10,
+            min_minutes_between_shifts=60 * 10,
+            max_consecutive_workdays=6, )
+
+        shifts = self._build_shifts(rng)
+        employees = [self._build_employee(rng, user_id, environment)
+                     for user_id in range(1, self.employees + 1)]
+        return environment, employees, shifts
+
+    def _build_shifts(self, rng):
+        # More overlap means fewer distinct start times to share
+        starts = max(1, int(round(self.shifts * (1 - self.overlap))))
+        start_hours = [rng.randrange(0, 7 * HOURS_PER_DAY)
+                       for _ in range(starts)]
+
+        shifts = []
+        for shift_id in range(1, self.shifts + 1):
+            start = WEEK_START + timedelta(hours=rng.choice(start_hours))
+            stop = start + timedelta(hours=rng.randint(4, 8))
+            shifts.append(Shift({
+                "id": shift_id,
+                "user_id": 0,
+                "start": start.strftime(DATETIME_FORMAT),
+                "stop": stop.strftime(DATETIME_FORMAT),
+            }))
+        return shifts
+
+    def _build_employee(self, rng, user_id, environment):
+        working_hours = {}
+        preferences = {}
+        for day in week_day_range():
+            # Available days have one window of working hours
+            working_hours[day] = [0] * HOURS_PER_DAY
+            if rng.random() < self.availability:
+                start = rng.randint(0, 8)
+                stop = rng.randint(16, HOURS_PER_DAY)
+                working_hours[day][start:stop] = [1] * (stop - start)
+            preferences[day] = [rng.randint(0, 1)
+                                for _ in range(HOURS_PER_DAY)]
+
+        time_off_requests = []
+        if rng.random() < self.time_off_rate:
+            day_off = WEEK_START + timedelta(days=rng.randrange(7), hours=12)
+            time_off_requests.append(Record({
+                "state": "approved_paid",
+                "minutes_paid": 8 * 60,
+                "start": day_off.strftime(DATETIME_FORMAT),
+            }))
+
+        min_hours = rng.choice([0, 10, 20])
+        return Employee(user_id=user_id,
+                        min_hours_per_workweek=min_hours,
+                        max_hours_per_workweek=min_hours + 20,
+                        preferences=preferences,
+                        working_hours=working_hours,
+                        time_off_requests=time_off_requests,
+                        preceding_day_worked=rng.random() < 0.5,
+                        preceding_days_worked_streak=rng.randint(0, 6),
+                        existing_shifts=[],
+                        environment=environment)
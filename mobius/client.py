@@ -0,0 +1,134 @@
+"""
+One staffjoy client per process.
+
+The staffjoy library calls the module level functions of requests, so every
+call opens a new connection (and TLS handshake). get_client() points the
+library at one requests.Session with a pooled, keep-alive adapter instead,
+and get_role() (or role_handle()) builds role handles from ids without fetching the
+organization, location and role on the way.
+"""
+
+from datetime import datetime
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+import staffjoy
+from staffjoy import resource
+from staffjoy.resources.role import Role
+from staffjoy.resources.schedule import Schedule
+from staffjoy.resources.shift import Shift
+
+from mobius import config
+
+_lock = threading.Lock()
+_client = None
+_session = None
+
+
+class SessionRequests(object):
+    """Stands in for the requests module inside staffjoy.resource, sending
+    its calls through a session"""
+
+    def __init__(self, session):
+        self.session = session
+
+    def get(self, url, **kwargs):
+        return self.session.get(url, **self._with_timeout(kwargs))
+
+    def post(self, url, **kwargs):
+        return self.session.post(url, **self._with_timeout(kwargs))
+
+    def patch(self, url, **kwargs):
+        return self.session.patch(url, **self._with_timeout(kwargs))
+
+    def delete(self, url, **kwargs):
+        return self.session.delete(url, **self._with_timeout(kwargs))
+
+    @staticmethod
+    def _with_timeout(kwargs):
+        # Without one, a dead connection hangs forever instead of failing
+        kwargs.setdefault("timeout", config.API_TIMEOUT_SECONDS)
+        return kwargs
+
+    def __getattr__(self, name):
+        # e.g. requests.codes
+        return getattr(requests, name)
+
+
+def _build_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1,
+                          pool_maxsize=config.API_POOL_SIZE)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_client():
+    """Return the process-wide staffjoy client"""
+    global _client, _session
+    with _lock:
+        if _client is None:
+            _session = _build_session()
+            resource.requests = SessionRequests(_session)
+            _client = staffjoy.Client(key=config.STAFFJOY_API_KEY,
+                                      env=config.ENV)
+        return _client
+
+
+def reset_client():
+    """Close the pooled connections. The next get_client() starts over."""
+    global _client, _session
+    with _lock:
+        if _session is not None:
+            _session.close()
+        _client = None
+        _session = None
+
+
+def get_role(environment):
+    """Return a handle to the environment's role without any api calls.
+
+    Its data is empty - use it to reach child resources like shifts.
+    """
+    return role_handle(environment.organization_id, environment.location_id,
+                       environment.role_id)
+
+
+def role_handle(organization_id, location_id, role_id):
+    """Return a handle to a role by its ids, like get_role()"""
+    client = get_client()
+    return Role(key=client.key,
+                config=client.config,
+                data={},
+                route={
+                    "organization_id": organization_id,
+                    "location_id": location_id,
+                    "role_id": role_id,
+                })
+
+
+def get_shift(role, shift_id):
+    """Return a handle to a shift of the role without any api calls"""
+    return Shift.get(parent=role, id=shift_id, data={"id": shift_id})
+
+
+def get_schedule(role, schedule_id):
+    """Return a handle to a schedule of the role without any api calls"""
+    return Schedule.get(parent=role, id=schedule_id, data={"id": schedule_id})
+
+
+def patch(resource_obj, **kwargs):
+    """Like Resource.patch, but without refetching the resource afterwards,
+    so it's one request instead of two. Updates data with kwargs."""
+    start = datetime.now()
+    r = resource.requests.patch(resource_obj._url(),
+                                auth=(resource_obj.key, ""),
+                                data=kwargs)
+    resource_obj._delay_for_ratelimits(start)
+
+    if r.status_code not in resource_obj.TRUTHY_CODES:
+        return resource_obj._handle_request_exception(r)
+
+    resource_obj.data.update(kwargs)
@@ -0,0 +1,86 @@
+"""
+Run api calls concurrently, with a bound and retries.
+
+The api has no bulk endpoints, so speed comes from overlapping requests on
+the shared session (see mobius.client) - each one also waits out the
+client's rate limit delay, which overlaps too.
+"""
+
+from multiprocessing.pool import ThreadPool
+import random
+from time import sleep
+
+import requests
+
+from mobius import config, logger
+
+
+def is_retryable(e):
+    """Whether an api call that raised e might succeed if tried again"""
+    if isinstance(e, (requests.exceptions.ConnectionError,
+                      requests.exceptions.Timeout)):
+        return True
+
+    # staffjoy raises HTTPError for codes it has no exception for
+    if isinstance(e, requests.exceptions.HTTPError) and \
+            e.response is not None:
+        return e.response.status_code >= 500 or \
+            e.response.status_code == requests.codes.too_many_requests
+
+    return False
+
+
+class Backoff(object):
+    """Exponential backoff with jitter. Each delay doubles up to cap, and is
+    randomized to between half and all of that so that many callers don't
+    retry in lockstep."""
+
+    def __init__(self, base, cap):
+        self.base = base
+        self.cap = cap
+        self.attempts = 0
+
+    def delay(self):
+        """Return the next delay in seconds"""
+        delay = min(self.cap, self.base * 2**self.attempts)
+        if delay < self.cap:
+            self.attempts += 1
+        return delay * random.uniform(0.5, 1)
+
+    def reset(self):
+        self.attempts = 0
+
+
+def call_with_retries(fn):
+    """Call fn, retrying with backoff on errors that might be temporary"""
+    backoff = Backoff(config.API_RETRY_BACKOFF_SECONDS,
+                      config.API_RETRY_MAX_BACKOFF_SECONDS)
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except Exception as e:
+            if attempt >= config.API_RETRIES or not is_retryable(e):
+                raise
+
+            delay = backoff.delay()
+            logger.info("Api call failed (%s) - retrying in %.1f seconds" %
+                        (e, delay))
+            sleep(delay)
+            attempt += 1
+
+
+def run_concurrently(functions, concurrency=None):
+    """Call each function (with retries) on at most concurrency threads and
+    return their results in order. The first error is raised."""
+    concurrency = concurrency or config.API_CONCURRENCY
+
+    if len(functions) <= 1 or concurrency <= 1:
+        return [call_with_retries(fn) for fn in functions]
+
+    pool = ThreadPool(min(concurrency, len(functions)))
+    try:
+        return pool.map(call_with_retries, functions)
+    finally:
+        pool.terminate()
+        pool.join()
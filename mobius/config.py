@@ -11,25 +11,79 @@ class DefaultConfig:
     # Logging
     PAPERTRAIL = "logs2.papertrailapp.com:12345"
 
+    # Polling for tasks backs off from the min to the max interval while the
+    # queue is empty (or erroring, or tasks are failing), and polls again
+    # right after tasks that succeeded
+    TASKING_MIN_FETCH_INTERVAL_SECONDS = 1
     TASKING_FETCH_INTERVAL_SECONDS = 20
+    TASKING_MAX_ERROR_INTERVAL_SECONDS = 2 * 60
+
+    # Worker processes claiming tasks - config.THREADS is split between them
+    TASKING_WORKERS = 1
+    SUPERVISOR_CHECK_INTERVAL_SECONDS = 10
+    # Prometheus text endpoint (None to disable). Under a supervisor it
+    # serves every worker's task metrics along with their health.
+    METRICS_PORT = 9090
+    TASKING_SHUTDOWN_TIMEOUT_SECONDS = 5 * 60  # Then unfinished tasks die
+    # Claim up to this many queued tasks for the same location and week at
+    # once, to process together sharing what they fetch from the api. A task
+    # for anywhere else ends the batch and goes back to the queue.
+    TASKING_BATCH_SIZE = 1
+    # Within a batch, count shifts a worker has (or was just assigned) in the
+    # location's other roles against their hours and rest in the next role
+    TASKING_BATCH_CROSS_ROLE = False
     STAFFJOY_API_KEY = os.environ.get("STAFFJOY_API_KEY")
+    API_POOL_SIZE = 10  # Keep-alive connections to the api
+    API_TIMEOUT_SECONDS = 60
+    API_CONCURRENCY = 8  # Api calls in flight at once (<= API_POOL_SIZE)
+    API_RETRIES = 3
+    API_RETRY_BACKOFF_SECONDS = 0.5  # Doubles each retry
+    API_RETRY_MAX_BACKOFF_SECONDS = 10
     DEFAULT_TZ = "utc"
     MAX_HOURS_PER_SHIFT = 23
 
     # Calculation stuff
+    SOLVER = "gurobi"  # Backend in mobius.solver - "gurobi" or "cbc"
     UNASSIGNED_PENALTY = -1000
     MIN_HOURS_VIOLATION_PENALTY = -1000
+
+    # Solve once with consecutive days off and happiness in the objective,
+    # instead of falling back through stages that drop them
+    SOFT_CONSTRAINTS = False
+    # Penalty for a worker without consecutive days off in soft mode. None
+    # keeps the staged order (days off, then coverage, then happiness): each
+    # worker's penalty outweighs every shift, min hours and happiness they
+    # could gain by working through. A number trades days off for coverage
+    # instead - e.g. -100 gives up days off to cover a single shift.
+    CONSECUTIVE_DAYS_OFF_VIOLATION_PENALTY = None
+    HAPPINESS_WEIGHT = 1
     THREADS = 16  # Max for what Dantzig can support
 
+    # Solve independent parts of a role (workers and shifts that share no
+    # constraints) as separate models, this many processes at once.
+    # THREADS is split between the processes. With Gurobi, each extra
+    # process opens its own environment and takes its own license token -
+    # up to TASKING_WORKERS * DECOMPOSE_PROCESSES tokens in all - so by
+    # default the parts are solved one after another in the worker.
+    DECOMPOSE = True
+    DECOMPOSE_PROCESSES = 1
+
     # Gurobi tuning parameters
     MAX_TUNING_TIME = 1 * 60 * 60  # 1 Hour
     TUNE_FILE = "tuning.prm"
 
+    # cProfile each constraint family while building the model, and write
+    # a flamegraph-compatible report (see mobius/profiling.py)
+    PROFILE_MODEL_BUILD = bool(os.environ.get("PROFILE_MODEL_BUILD"))
+    PROFILE_DIR = os.environ.get("PROFILE_DIR", "/tmp/mobius-profiles")
+
     # Happiness Timeout
     HAPPY_CALCULATION_TIMEOUT = 20 * 60  # 20 minutes
 
-    # Destroy container if there was an error
+    # Failed tasks reset the solver and api client in process. After this
+    # many in a row, destroy the container (or the worker, if supervised).
     KILL_ON_ERROR = True
+    RECOVERY_MAX_CONSECUTIVE_FAILURES = 3
     KILL_DELAY = 60  # To prevent infinite loop, sleep before kill
 
 
@@ -54,6 +108,7 @@ class TestConfig(DefaultConfig):
     LOG_LEVEL = logging.DEBUG
     THREADS = 6
     KILL_ON_ERROR = False
+    SOLVER = "cbc"  # CI has no Gurobi license
 
 
 config = {  # Determined in main.py
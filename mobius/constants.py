@@ -1,6 +1,7 @@
 """Constant values used across Mobius"""
 
 HOURS_PER_DAY = 24
+HOURS_PER_WEEK = 7 * HOURS_PER_DAY
 MINUTES_PER_HALF_HOUR = 30
 MINUTES_PER_HOUR = 60
 SECONDS_PER_MINUTE = 60
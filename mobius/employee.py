@@ -2,17 +2,17 @@ from copy import deepcopy
 from datetime import timedelta
 import iso8601
 
-import staffjoy
 from staffjoy.exceptions import NotFoundException
 
-from mobius import config, logger
+from mobius import logger, history
+from mobius.client import get_role
 from mobius.shift import Shift
 from mobius.helpers import week_day_range, week_range_all_true, dt_to_query_str, \
-    dt_to_day, dt_overlaps
+    dt_to_day, dt_overlaps, week_to_mask
 from mobius.constants import MINUTES_PER_HOUR, HOURS_PER_DAY, APPROVED_TIME_OFF_STATES
 
 
-class Employee:
+class Employee(object):
     """ Extends a person for context within a business """
 
     def __init__(self,
@@ -22,13 +22,23 @@ class Employee:
                  preferences=None,
                  working_hours=None,
                  time_off_requests=None,
-                 preceding_day_worked=False,
+                 preceding_day_worked=None,
                  preceding_days_worked_streak=None,
                  existing_shifts=None,
-                 environment=None):
-        """Create a worker based on the person and business info"""
+                 environment=None,
+                 role=None,
+                 recent_shifts=None):
+        """Create a worker based on the person and business info.
+
+        role is the staffjoy role used for anything not passed in - by
+        default a handle built from the environment. recent_shifts are the
+        worker's shifts from history.lookback_start() to the end of the
+        week, and are fetched (once) if any history is not passed in.
+        """
 
         self.user_id = user_id
+        self.role = role
+        self._availability_mask = None
         self.min_hours_per_workweek = min_hours_per_workweek
         self.max_hours_per_workweek = max_hours_per_workweek
         self.environment = environment
@@ -48,20 +58,33 @@ class Employee:
             time_off_requests = self._fetch_time_off_requests()
         self._process_time_off_requests(time_off_requests)
 
+        self.recent_shifts = recent_shifts
+
         if preceding_day_worked is not None:
             self.preceding_day_worked = preceding_day_worked
         else:
-            self._fetch_preceding_day_worked()
+            self.preceding_day_worked = history.preceding_day_worked(
+                self.environment, self._get_recent_shifts())
 
         if preceding_days_worked_streak is not None:
             self.preceding_days_worked_streak = preceding_days_worked_streak
         else:
-            self._fetch_preceding_days_worked_streak()
+            self.preceding_days_worked_streak = \
+                history.preceding_days_worked_streak(
+                    self.environment, self._get_recent_shifts())
 
         if existing_shifts is not None:
             self.existing_shifts = existing_shifts
         else:
-            self._fetch_existing_shifts()
+            self.existing_shifts = history.existing_shifts(
+                self.environment, self._get_recent_shifts())
+
+        if self.recent_shifts is not None:
+            # Edge case - mark the first day of week as
+            # active if the person works past midnight
+            for day in history.carried_over_days(self.environment,
+                                                 self.recent_shifts):
+                self.active_days[day] = True
 
         self._process_existing_shifts()
         self._filter_preferences()
@@ -92,7 +115,7 @@ class Employee:
         role = self._get_role_client()
         worker = role.get_worker(self.user_id)
         self.availability = worker.data.get("working_hours")
-        if not self.availability:
+        if not self._availability:
             self.availability = week_range_all_true()
 
     def _fetch_time_off_requests(self):
@@ -105,94 +128,38 @@ class Employee:
         return worker.get_time_off_requests(start=self.environment.start,
                                             end=self.environment.stop)
 
-    def _fetch_preceding_day_worked(self):
-        """Fetch from api whether worker worked the day before this week began.
-        Used for consecutive days off.
-        """
-        logger.debug("Fetching preceding day worked for user %s" %
-                     self.user_id)
-        search_end = self.environment.start
-        search_start = search_end - timedelta(days=1)
-        shifts_objs = self._get_role_client().get_shifts(
-            start=dt_to_query_str(search_start),
-            end=dt_to_query_str(search_end),
-            user_id=self.user_id, )
-
-        for shift in shifts_objs:
-            # Edge case - mark the first day of week as
-            # active if the person works past midnight
-            if shift.stop > self.environment.start:
-                self.active_days[dt_to_day(
-                    self.environment.datetime_utc_to_local(shift.stop))] = True
-
-        self.preceding_day_worked = len(shifts_objs) > 0
-
-    def _fetch_preceding_days_worked_streak(self):
-        """See how many days in an row the worker has worked prior to the
-        beginning of this week.
-        """
-        logger.debug("Fetching preceding day streak for user %s" %
-                     self.user_id)
-        # Search up to max_consecutive_workdays - beyond doesn't matter
-        streak = 0
-        for t in range(self.environment.max_consecutive_workdays):
-            # Build search
-            search_end = self.environment.start - timedelta(days=t)
-            search_start = search_end - timedelta(days=1)
-
-            shifts_obj = self._get_role_client().get_shifts(
-                start=dt_to_query_str(search_start - timedelta(
-                    hours=config.MAX_HOURS_PER_SHIFT)),
-                end=dt_to_query_str(search_end),
-                user_id=self.user_id, )
-            if len([s for s in shifts_obj
-                    if (Shift(s).start >= search_start) > 0]):
-                streak += 1
-            else:
-                # Streak over!
-                return streak
-        return streak
-
-    def _fetch_existing_shifts(self):
-        """Look for fixed shifts and other stuff"""
-        logger.debug("Fetching existing shifts for user %s" % self.user_id)
-        self.existing_shifts = []
-        shifts_obj_raw = self._get_role_client().get_shifts(
-            start=dt_to_query_str(self.environment.start - timedelta(
-                hours=config.MAX_HOURS_PER_SHIFT)),
-            end=dt_to_query_str(self.environment.stop),
-            user_id=self.user_id)
-
-        shifts_obj = []
-        for s in shifts_obj_raw:
-            shifts_obj.append(Shift(s))
-
-        for s in [s for s in shifts_obj if s.start >= self.environment.start]:
+    def _get_recent_shifts(self):
+        """Fetch the worker's shifts for the lookback window and the week in
+        one api call. Preceding day worked, streak and existing shifts are
+        all derived from these."""
+        if self.recent_shifts is None:
+            logger.debug("Fetching recent shifts for user %s" % self.user_id)
+            shifts_objs = self._get_role_client().get_shifts(
+                start=dt_to_query_str(history.lookback_start(
+                    self.environment)),
+                end=dt_to_query_str(self.environment.stop),
+                user_id=self.user_id)
+            self.recent_shifts = [Shift(s) for s in shifts_objs]
+
+        return self.recent_shifts
 
+    def _process_existing_shifts(self):
+        """Set self to active during shifts, and decrease hours to be
+        scheduled by them"""
+        for s in self.existing_shifts:
             logger.info("Found existing shift %s for user %s" %
                         (s.shift_id, self.user_id))
 
-            self.existing_shifts.append(s)
-
-            # Also decrease hours to be scheduled by that
             self.min_hours_per_workweek -= 1.0 * s.total_minutes(
             ) / MINUTES_PER_HOUR
             if self.min_hours_per_workweek < 0:
                 self.min_hours_per_workweek = 0
 
-            self.max_hours_per_workweek -= 1.0 * s.total_minutes(
-            ) / MINUTES_PER_HOUR
-            if self.max_hours_per_workweek < 0:
-                self.min_hours_per_workweek = 0
-
             self.max_hours_per_workweek -= 1.0 * s.total_minutes(
             ) / MINUTES_PER_HOUR
             if self.max_hours_per_workweek < 0:
                 self.max_hours_per_workweek = 0
 
-    def _process_existing_shifts(self):
-        """Set self to active during shifts."""
-        for s in self.existing_shifts:
             self.active_days[dt_to_day(s.start)] = True
             # only mark end day as active if it's within week (aka not overlap)
             if s.stop < self.environment.stop:
@@ -224,71 +191,67 @@ class Employee:
             # Get day of week for request and update availability
             day_of_week = dt_to_day(self.environment.datetime_utc_to_local(
                 iso8601.parse_date(r.data["start"])))
-            self.availability[day_of_week] = [0] * HOURS_PER_DAY
+            self._availability[day_of_week] = [0] * HOURS_PER_DAY
+            self._availability_mask = None
 
             logger.info("Marked user %s as unavailable on %s due to time off" %
                         (self.user_id, day_of_week))
 
-    def available_to_work(self, shift):
-        """Check whether the worker can work this shift"""
+    @property
+    def availability(self):
+        """Working hours as a week object ({day: [0/1] * 24}).
+
+        availability_mask is cached, so assign changed working hours back
+        (employee.availability = week) rather than only editing the lists.
+        """
+        return self._availability
+
+    @availability.setter
+    def availability(self, value):
+        self._availability = value
+        self._availability_mask = None
+
+    @property
+    def availability_mask(self):
+        """Working hours as a bitmask of the week (see week_to_mask)"""
+        if self._availability_mask is None:
+            self._availability_mask = week_to_mask(self._availability)
+        return self._availability_mask
+
+    def conflicts_with_existing_shifts(self, shift):
+        """Whether a shift overlaps (or is too close to) an existing shift"""
+        local = shift.local(self.environment)
+
         # Existing shifts - check whether violates min hours between or overlap
-        shift.start = self.environment.datetime_utc_to_local(shift.start)
-        shift.stop = self.environment.datetime_utc_to_local(shift.stop)
         for s in self.existing_shifts:
             if dt_overlaps(
                     s.start - timedelta(
                         minutes=self.environment.min_minutes_between_shifts),
                     s.stop + timedelta(
                         minutes=self.environment.min_minutes_between_shifts),
-                    shift.start,
-                    shift.stop):
-                return False
+                    local.start,
+                    local.stop):
+                return True
 
-        # todo - compare to self.availability
-        s_start_local = self.environment.datetime_utc_to_local(shift.start)
-        s_stop_local = self.environment.datetime_utc_to_local(shift.stop)
+        return False
 
-        s_start_day = dt_to_day(s_start_local)
-        s_stop_day = dt_to_day(s_stop_local)
-
-        # What hour to search to - if it's exactly on the hour, then exclude (because search inclusive -> exclusive)
-        if s_stop_local.minute + s_stop_local.second + s_stop_local.microsecond > 0:
-            search_stop_hour = s_stop_local.hour + 1
-        else:
-            search_stop_hour = s_stop_local.hour
-
-            # Bug fix - if it's exactly midnight, then roll back day
-            if search_stop_hour is 0:
-                # Roll back start day
-                s_stop_day = s_start_day
-
-        if s_start_day == s_stop_day:
-            # Same start and stop day
-
-            for t in range(s_start_local.hour, search_stop_hour):
-                if self.availability[s_start_day][t] != 1:
-                    return False
-        else:
-            # Different start and stop days
-
-            # Day 1 (start -> end of day)
-            for t in range(s_start_local.hour, HOURS_PER_DAY):
-                if self.availability[s_start_day][t] != 1:
-                    return False
+    def available_to_work(self, shift):
+        """Check whether the worker can work this shift.
 
-            # Day 2 (start of day -> stop)
-            for t in range(search_stop_hour):
-                if self.availability[s_stop_day][t] != 1:
-                    return False
+        This only reads the shift (and its cached local times), so it is
+        safe to call for many employees and shifts in any order.
+        """
+        if self.conflicts_with_existing_shifts(shift):
+            return False
 
-        return True
+        # Every hour of the shift must be a working hour
+        return shift.local(self.environment).hour_mask & \
+            ~self.availability_mask == 0
 
     def _get_role_client(self):
-        c = staffjoy.Client(key=config.STAFFJOY_API_KEY, env=config.ENV)
-        org = c.get_organization(self.environment.organization_id)
-        loc = org.get_location(self.environment.location_id)
-        role = loc.get_role(self.environment.role_id)
-        return role
+        if self.role is None:
+            self.role = get_role(self.environment)
+        return self.role
 
     def _filter_preferences(self):
         raw_prefs = deepcopy(self.preferences)
@@ -296,7 +259,7 @@ class Employee:
         for day in week_day_range():
             # Dot product so that preference is only valid when available
             processed_prefs[day] = [
-                a * b for a, b in zip(self.availability[day], raw_prefs[day])
+                a * b for a, b in zip(self._availability[day], raw_prefs[day])
             ]
 
         self.preferences = processed_prefs
@@ -310,7 +273,7 @@ class Employee:
         sum_preferences = 0
 
         for day in week_day_range():
-            sum_availability += sum(self.availability[day])
+            sum_availability += sum(self._availability[day])
             sum_preferences += sum(self.preferences[day])
 
         if sum_preferences == sum_availability or sum_preferences == 0 or sum_availability == 0:
@@ -327,11 +290,9 @@ class Employee:
 
     def shift_happiness_score(self, shift):
         """Return the happiness shift for a given shift"""
-        s_start_local = self.environment.datetime_utc_to_local(shift.start)
-        s_stop_local = self.environment.datetime_utc_to_local(shift.stop)
-
-        s_start_day = dt_to_day(s_start_local)
-        s_stop_day = dt_to_day(s_stop_local)
+        local = shift.local(self.environment)
+        s_start_day = local.start_day
+        s_stop_day = local.stop_day
 
         score = 0.0
 
@@ -339,20 +300,20 @@ class Employee:
 
         if s_start_day == s_stop_day:
             # Same day
-            for t in range(s_start_local.hour, s_stop_local.hour):
+            for t in range(local.start_hour, local.stop_hour):
                 if self.preferences[s_start_day] == 1:
                     score += 1 + self.alpha
                 else:
                     score += 1 - self.beta
         else:
             # start and end on different days
-            for t in range(s_start_local.hour, HOURS_PER_DAY):
+            for t in range(local.start_hour, HOURS_PER_DAY):
                 if self.preferences[s_start_day] == 1:
                     score += 1 + self.alpha
                 else:
                     score += 1 - self.beta
 
-            for t in range(s_stop_local.hour):
+            for t in range(local.stop_hour):
                 if self.preferences[s_stop_day] == 1:
                     score += 1 + self.alpha
                 else:
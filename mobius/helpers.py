@@ -28,6 +28,29 @@ def week_sum(week_range_obj):
     return sigma
 
 
+def week_to_mask(week_range_obj):
+    """Convert a week object to an int with one bit per hour of the week.
+
+    Bit (day index * 24 + hour) is set when that hour is 1, with days in
+    week_day_range() order.
+    """
+    mask = 0
+    for day_index, day in enumerate(week_day_range()):
+        for hour, value in enumerate(week_range_obj[day]):
+            if value == 1:
+                mask |= 1 << (day_index * HOURS_PER_DAY + hour)
+    return mask
+
+
+def hours_to_mask(day, start_hour, stop_hour):
+    """Bitmask (see week_to_mask) of hours [start_hour, stop_hour) on day"""
+    offset = week_day_range().index(day) * HOURS_PER_DAY
+    mask = 0
+    for hour in range(start_hour, stop_hour):
+        mask |= 1 << (offset + hour)
+    return mask
+
+
 def normalize_to_midnight(dt_obj):
     """Take a datetime and round it to midnight"""
     return dt_obj.replace(hour=0, minute=0, second=0, microsecond=0)
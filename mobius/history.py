@@ -0,0 +1,57 @@
+"""
+Derive a worker's recent history from their shifts.
+
+These work on a list of one worker's shifts (mobius.shift.Shift) covering
+at least lookback_start(environment) through the end of the week, so a
+single shift query can answer all of them.
+"""
+
+from datetime import timedelta
+
+from mobius import config
+from mobius.helpers import dt_to_day
+
+
+def lookback_start(environment):
+    """Earliest time any history depends on - the streak can reach back
+    max_consecutive_workdays, plus a shift that started before that"""
+    return environment.start - timedelta(
+        days=environment.max_consecutive_workdays,
+        hours=config.MAX_HOURS_PER_SHIFT)
+
+
+def existing_shifts(environment, shifts):
+    """Shifts the worker already has this week"""
+    return [s for s in shifts
+            if s.start >= environment.start and s.start < environment.stop]
+
+
+def preceding_day_worked(environment, shifts):
+    """Whether the worker had a shift starting the day before the week"""
+    search_end = environment.start
+    search_start = search_end - timedelta(days=1)
+    return any(search_start <= s.start < search_end for s in shifts)
+
+
+def preceding_days_worked_streak(environment, shifts):
+    """How many days in a row the worker worked right before the week,
+    up to max_consecutive_workdays (beyond doesn't matter)"""
+    streak = 0
+    for t in range(environment.max_consecutive_workdays):
+        search_end = environment.start - timedelta(days=t)
+        search_start = search_end - timedelta(days=1)
+
+        if any(search_start <= s.start < search_end for s in shifts):
+            streak += 1
+        else:
+            # Streak over!
+            break
+    return streak
+
+
+def carried_over_days(environment, shifts):
+    """Days of the week a worker is already active on because a shift from
+    before the week runs past its start"""
+    return set(dt_to_day(environment.datetime_utc_to_local(s.stop))
+               for s in shifts
+               if s.start < environment.start and s.stop > environment.start)
@@ -0,0 +1,110 @@
+from datetime import timedelta
+import calendar
+
+import numpy as np
+
+from mobius.helpers import week_day_range
+from mobius.constants import SECONDS_PER_MINUTE, HOURS_PER_WEEK
+
+
+def dt_to_timestamp(dt_obj):
+    """Seconds since the epoch for a timezone-aware datetime"""
+    return calendar.timegm(dt_obj.utctimetuple())
+
+
+def mask_to_array(mask):
+    """Convert a week bitmask (see week_to_mask) to a bool array of hours"""
+    return np.array(
+        [(mask >> hour) & 1 for hour in range(HOURS_PER_WEEK)],
+        dtype=bool)
+
+
+class Incidence():
+    """NumPy arrays of how shifts relate to days, workdays and employees.
+
+    Everything the model needs from the datetimes is computed here once, so
+    building constraints is only indexing into these arrays.
+
+    * minutes - (shifts,) length of each shift in minutes, rounded up
+    * day - (shifts, days) whether a shift counts towards a day, with days
+      ordered like week_day_range()
+    * workday_minutes - (shifts, workdays) minutes of each shift inside each
+      24 hour workday from the environment start
+    * available - (employees, shifts) whether an employee can work a shift
+    """
+
+    def __init__(self, environment, employees, shifts):
+        self.environment = environment
+        self.days = week_day_range()
+
+        self.minutes = np.array(
+            [s.local(environment).total_minutes for s in shifts],
+            dtype=np.int64)
+        self.day = self._build_day(shifts)
+        self.workday_minutes = self._build_workday_minutes(shifts)
+        self.available = self._build_available(employees, shifts)
+
+    def _build_day(self, shifts):
+        """A shift counts on its start day, and on its stop day when it
+        stops within the week"""
+        day = np.zeros((len(shifts), len(self.days)), dtype=bool)
+        for i, s in enumerate(shifts):
+            local = s.local(self.environment)
+            day[i, self.days.index(local.start_day)] = True
+            if s.stop <= self.environment.stop:
+                day[i, self.days.index(local.stop_day)] = True
+
+        return day
+
+    def _build_workday_minutes(self, shifts):
+        """Minutes of overlap between every shift and every workday"""
+        # Workdays are consecutive 24 hour periods from the start of the week
+        workday_starts = []
+        workday_start = self.environment.start
+        while workday_start < self.environment.stop:
+            workday_starts.append(dt_to_timestamp(workday_start))
+            workday_start += timedelta(days=1)
+        workday_starts = np.array(workday_starts, dtype=np.int64)
+        workday_stops = workday_starts + int(timedelta(days=1).total_seconds())
+
+        starts = np.array(
+            [dt_to_timestamp(s.start) for s in shifts],
+            dtype=np.int64)
+        stops = np.array(
+            [dt_to_timestamp(s.stop) for s in shifts],
+            dtype=np.int64)
+
+        # Broadcast to (shifts, workdays)
+        overlap_seconds = (
+            np.minimum(stops[:, np.newaxis], workday_stops[np.newaxis, :]) -
+            np.maximum(starts[:, np.newaxis], workday_starts[np.newaxis, :]))
+        overlap_seconds = np.maximum(overlap_seconds, 0)
+
+        return np.ceil(1.0 * overlap_seconds /
+                       SECONDS_PER_MINUTE).astype(np.int64)
+
+    def _build_available(self, employees, shifts):
+        """Same as Employee.available_to_work for every pair"""
+        # (employees, hours) and (shifts, hours)
+        unavailable_hours = np.array(
+            [~mask_to_array(e.availability_mask) for e in employees],
+            dtype=np.int64).reshape(
+                len(employees), HOURS_PER_WEEK)
+        shift_hours = np.array(
+            [mask_to_array(s.local(self.environment).hour_mask)
+             for s in shifts],
+            dtype=np.int64).reshape(
+                len(shifts), HOURS_PER_WEEK)
+
+        # Available when no hour of the shift is an unavailable hour
+        available = unavailable_hours.dot(shift_hours.T) == 0
+
+        # Few workers have existing shifts, so check those pair by pair
+        for i, e in enumerate(employees):
+            if not e.existing_shifts:
+                continue
+            for j in np.flatnonzero(available[i]):
+                if e.conflicts_with_existing_shifts(shifts[j]):
+                    available[i, j] = False
+
+        return available
@@ -0,0 +1,104 @@
+from collections import defaultdict
+from functools import partial
+
+from mobius import history, logger
+from mobius.concurrency import run_concurrently
+from mobius.employee import Employee
+from mobius.shift import Shift
+from mobius.helpers import week_range_all_true, dt_to_query_str
+
+
+class RoleLoader():
+    """Fetch everything needed to build a role's employees in a fixed number
+    of api calls, instead of several per employee.
+
+    Workers, preferences, time off requests and the lookback window of shifts
+    are each fetched once for the whole role and split up by user here. Each
+    Employee derives its history from its share of the shifts.
+    """
+
+    def __init__(self, role, schedule, environment):
+        self.role = role
+        self.schedule = schedule
+        self.environment = environment
+
+    def load_employees(self):
+        """Return an Employee for every active worker in the role"""
+        self.fetch()
+        return self.build_employees()
+
+    def fetch(self):
+        """Make the api calls"""
+        self.workers, self.preferences, self.time_off_requests, \
+            self.shifts = run_concurrently([
+                partial(self.role.get_workers, archived=False),
+                self._fetch_preferences,
+                self._fetch_time_off_requests,
+                self._fetch_shifts,
+            ])
+
+    def add_shifts(self, shifts):
+        """Count other assigned shifts (e.g. of the location's other roles)
+        in workers' history. Call between fetch() and build_employees().
+        Shifts that were already fetched are skipped."""
+        known = set(s.shift_id
+                    for user_shifts in self.shifts.values()
+                    for s in user_shifts)
+        for s in shifts:
+            if s.user_id and s.shift_id not in known:
+                self.shifts[s.user_id].append(s)
+                known.add(s.shift_id)
+
+    def build_employees(self):
+        """Build employees from what fetch() got, without api calls"""
+        preferences = self.preferences
+        time_off_requests = self.time_off_requests
+        shifts = self.shifts
+
+        employees = []
+        for worker in self.workers:
+            user_id = worker.data["id"]
+            employees.append(Employee(
+                user_id=user_id,
+                min_hours_per_workweek=worker.data["min_hours_per_workweek"],
+                max_hours_per_workweek=worker.data["max_hours_per_workweek"],
+                preferences=preferences.get(user_id) or week_range_all_true(),
+                working_hours=worker.data.get(
+                    "working_hours") or week_range_all_true(),
+                time_off_requests=time_off_requests[user_id],
+                recent_shifts=shifts[user_id],
+                environment=self.environment,
+                role=self.role, ))
+
+        return employees
+
+    def _fetch_preferences(self):
+        """Return {user_id: preference} for the schedule"""
+        logger.debug("Fetching preferences for schedule %s" %
+                     self.environment.schedule_id)
+        preferences = {}
+        for p in self.schedule.get_preferences():
+            preferences[p.data.get("user_id")] = p.data.get("preference")
+        return preferences
+
+    def _fetch_time_off_requests(self):
+        """Return {user_id: [time off request]} for the schedule"""
+        logger.debug("Fetching time off requests for schedule %s" %
+                     self.environment.schedule_id)
+        requests = defaultdict(list)
+        for r in self.schedule.get_schedule_time_off_requests():
+            requests[r.data.get("user_id")].append(r)
+        return requests
+
+    def _fetch_shifts(self):
+        """Return {user_id: [Shift]} from the lookback window to the end of
+        the week"""
+        logger.debug("Fetching shifts for role %s" % self.environment.role_id)
+        shifts = defaultdict(list)
+        for s in self.role.get_shifts(
+                start=dt_to_query_str(history.lookback_start(
+                    self.environment)),
+                end=dt_to_query_str(self.environment.stop)):
+            shift = Shift(s)
+            shifts[shift.user_id].append(shift)
+        return shifts
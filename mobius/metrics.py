@@ -0,0 +1,172 @@
+"""
+Timings and model statistics for each task.
+
+A Metrics object collects what happened during one task. When the task ends
+it is logged as one structured (JSON) line and added to the process-wide
+registry, which renders in the Prometheus text format for the metrics
+endpoint.
+"""
+
+from collections import OrderedDict
+from contextlib import contextmanager
+import json
+import multiprocessing
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+from mobius import logger
+
+PREFIX = "mobius"
+
+
+class Metrics(object):
+    """What happened during one task"""
+
+    def __init__(self, **labels):
+        self.labels = labels
+        self.timings = OrderedDict()  # {phase: seconds}
+        self.values = OrderedDict()  # {name: value}
+
+    @contextmanager
+    def timer(self, phase):
+        """Add the wall time of the block to phase"""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add_time(phase, time.time() - start)
+
+    def add_time(self, phase, seconds):
+        self.timings[phase] = self.timings.get(phase, 0) + seconds
+
+    def set(self, name, value):
+        self.values[name] = value
+
+    def as_dict(self):
+        data = OrderedDict(self.labels)
+        data["seconds"] = self.timings
+        data.update(self.values)
+        return data
+
+    def finish(self, success, registry=None):
+        """Log the task's metrics and add them to the registry"""
+        self.set("success", success)
+        logger.info("Task metrics %s" % json.dumps(self.as_dict()))
+        (registry or REGISTRY).record(self, success)
+
+
+class Registry(object):
+    """Totals over every task this process has run"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tasks = {}  # {result: count}
+        self.phase_seconds = {}  # {phase: [sum, count]}
+        self.stages = {}  # {stage: count}
+        self.last = {}  # {name: value} from the last task
+
+    def record(self, metrics, success):
+        with self.lock:
+            result = "success" if success else "failure"
+            self.tasks[result] = self.tasks.get(result, 0) + 1
+
+            for phase, seconds in metrics.timings.items():
+                totals = self.phase_seconds.setdefault(phase, [0, 0])
+                totals[0] += seconds
+                totals[1] += 1
+
+            stage = metrics.values.get("stage")
+            if stage is not None:
+                self.stages[stage] = self.stages.get(stage, 0) + 1
+
+            for name, value in metrics.values.items():
+                if isinstance(value, (int, float)) and \
+                        not isinstance(value, bool):
+                    self.last[name] = value
+
+    def render(self):
+        """Return the totals in the Prometheus text format"""
+        lines = []
+        with self.lock:
+            lines.append("# TYPE %s_tasks_total counter" % PREFIX)
+            for result, count in sorted(self.tasks.items()):
+                lines.append('%s_tasks_total{result="%s"} %s' %
+                             (PREFIX, result, count))
+
+            lines.append("# TYPE %s_phase_seconds summary" % PREFIX)
+            for phase, (total, count) in sorted(self.phase_seconds.items()):
+                lines.append('%s_phase_seconds_sum{phase="%s"} %s' %
+                             (PREFIX, phase, total))
+                lines.append('%s_phase_seconds_count{phase="%s"} %s' %
+                             (PREFIX, phase, count))
+
+            lines.append("# TYPE %s_stage_total counter" % PREFIX)
+            for stage, count in sorted(self.stages.items()):
+                lines.append('%s_stage_total{stage="%s"} %s' %
+                             (PREFIX, stage, count))
+
+            for name, value in sorted(self.last.items()):
+                lines.append("# TYPE %s_last_%s gauge" % (PREFIX, name))
+                lines.append("%s_last_%s %s" % (PREFIX, name, value))
+
+        return "\n".join(lines) + "\n"
+
+
+class QueueRegistry(object):
+    """Sends each task's metrics to another process, which adds them to its
+    own registry - so workers' tasks show up on the supervisor's endpoint"""
+
+    def __init__(self):
+        self.queue = multiprocessing.Queue()
+
+    def record(self, metrics, success):
+        self.queue.put((metrics, success))
+
+    def forward(self, registry=None):
+        """Add queued metrics to registry on a daemon thread. Returns the
+        thread."""
+        registry = registry or REGISTRY
+
+        def receive():
+            while True:
+                metrics, success = self.queue.get()
+                registry.record(metrics, success)
+
+        thread = threading.Thread(target=receive)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+
+REGISTRY = Registry()
+
+
+def start_metrics_server(port, render=None):
+    """Serve render() (by default the registry) over http on a daemon
+    thread. Returns the server."""
+    render = render or REGISTRY.render
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Scrapes would flood the logs
+            pass
+
+    server = HTTPServer(("", port), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    logger.info("Serving metrics on port %s" % port)
+    return server
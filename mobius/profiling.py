@@ -0,0 +1,90 @@
+"""
+Profile model building one section (constraint family) at a time.
+
+Turn on with PROFILE_MODEL_BUILD. Each section gets its own cProfile, and
+the report is written as:
+
+* <name>.folded - collapsed stacks of "section;function self-microseconds",
+  for flamegraph.pl or speedscope
+* <name>.prof - the merged pstats, for snakeviz or pstats
+"""
+
+from collections import OrderedDict
+from contextlib import contextmanager
+import cProfile
+import os
+import pstats
+
+from mobius import logger
+
+
+class BuildProfiler(object):
+    """Profiles named sections when enabled, otherwise does nothing"""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.profiles = OrderedDict()  # {section: cProfile.Profile}
+
+    @contextmanager
+    def section(self, name):
+        if not self.enabled:
+            yield
+            return
+
+        profile = self.profiles.setdefault(name, cProfile.Profile())
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+
+    def folded(self):
+        """Return collapsed stack lines of each function's own time in each
+        section"""
+        lines = []
+        for name, profile in self.profiles.items():
+            stats = pstats.Stats(profile).stats
+            for (filename, line, function), stat in stats.items():
+                microseconds = int(stat[2] * 1000000)  # tottime
+                if microseconds > 0:
+                    lines.append("%s;%s:%s:%s %s" %
+                                 (name, os.path.basename(filename), line,
+                                  function, microseconds))
+        return lines
+
+    def dump(self, directory, name):
+        """Write the report files and return their paths"""
+        if not self.profiles:
+            return []
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        base = os.path.join(directory, name)
+
+        with open(base + ".folded", "w") as f:
+            f.write("\n".join(self.folded()) + "\n")
+
+        profiles = list(self.profiles.values())
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        stats.dump_stats(base + ".prof")
+
+        paths = [base + ".folded", base + ".prof"]
+        logger.info("Wrote model build profile to %s" % ", ".join(paths))
+        return paths
+
+    def summary(self, limit=5):
+        """Return the slowest functions of each section as text"""
+        lines = []
+        for name, profile in self.profiles.items():
+            stats = pstats.Stats(profile).stats
+            total = sum(stat[2] for stat in stats.values())
+            lines.append("%s: %.3fs" % (name, total))
+            slowest = sorted(stats.items(),
+                             key=lambda item: item[1][2], reverse=True)[:limit]
+            for (filename, line, function), stat in slowest:
+                lines.append("    %.3fs %s:%s:%s" %
+                             (stat[2], os.path.basename(filename), line,
+                              function))
+        return "\n".join(lines)
@@ -1,12 +1,65 @@
+from collections import namedtuple
 import math
 
-from mobius.helpers import str_to_dt
-from mobius.constants import SECONDS_PER_MINUTE
+from mobius.helpers import str_to_dt, dt_to_day, hours_to_mask
+from mobius.constants import SECONDS_PER_MINUTE, HOURS_PER_DAY
 
 
-class Shift():
+class LocalShiftTimes(namedtuple("LocalShiftTimes", [
+        "start", "stop", "start_day", "stop_day", "start_hour", "stop_hour",
+        "search_stop_day", "search_stop_hour", "total_minutes", "hour_mask"
+])):
+    """A shift's times in an environment's timezone. Immutable, so it can be
+    shared between employees (and threads) safely."""
+
+    __slots__ = ()
+
+    @classmethod
+    def from_shift(cls, shift, environment):
+        start = environment.datetime_utc_to_local(shift.start)
+        stop = environment.datetime_utc_to_local(shift.stop)
+
+        start_day = dt_to_day(start)
+        stop_day = dt_to_day(stop)
+
+        # What hour to search to - if it's exactly on the hour, then
+        # exclude (because search inclusive -> exclusive)
+        search_stop_day = stop_day
+        if stop.minute + stop.second + stop.microsecond > 0:
+            search_stop_hour = stop.hour + 1
+        else:
+            search_stop_hour = stop.hour
+
+            # Bug fix - if it's exactly midnight, then roll back day
+            if search_stop_hour == 0:
+                search_stop_day = start_day
+
+        # Hours of the week a worker must be available for this shift
+        if start_day == search_stop_day:
+            hour_mask = hours_to_mask(start_day, start.hour, search_stop_hour)
+        else:
+            hour_mask = hours_to_mask(start_day, start.hour,
+                                      HOURS_PER_DAY) | hours_to_mask(
+                                          search_stop_day, 0, search_stop_hour)
+
+        return cls(start=start,
+                   stop=stop,
+                   start_day=start_day,
+                   stop_day=stop_day,
+                   start_hour=start.hour,
+                   stop_hour=stop.hour,
+                   search_stop_day=search_stop_day,
+                   search_stop_hour=search_stop_hour,
+                   total_minutes=shift.total_minutes(),
+                   hour_mask=hour_mask)
+
+
+class Shift(object):
     """Converts a shift api object to internal object"""
 
+    __slots__ = ["shift_id", "user_id", "original_user_id", "start", "stop",
+                 "_local", "_local_environment"]
+
     def __init__(self, shift_api_obj):
         # If you get a single shift, it's in data,
         # otherwise it's an interator of a dict
@@ -21,6 +74,19 @@ class Shift():
             self.start = str_to_dt(shift_api_obj["start"])
             self.stop = str_to_dt(shift_api_obj["stop"])
 
+        # What the api has, so write back can skip unchanged shifts
+        self.original_user_id = self.user_id
+
+        self._local = None
+        self._local_environment = None
+
+    def local(self, environment):
+        """Return LocalShiftTimes for the environment (cached)"""
+        if self._local_environment is not environment:
+            self._local = LocalShiftTimes.from_shift(self, environment)
+            self._local_environment = environment
+        return self._local
+
     def total_minutes(self):
         """Return length as minutes, rounded up"""
         return math.ceil(1.0 * (self.stop - self.start).total_seconds() /
@@ -0,0 +1,359 @@
+"""
+Mixed integer programming backends that Assign builds its model against.
+
+Assign only talks to the small interface on Solver, so the same model can
+be solved by Gurobi (needs a license token and the token server) or by an
+open-source engine. Pick one with config.SOLVER.
+"""
+
+import sys
+
+from mobius import config, logger
+
+# Variable types
+BINARY = "binary"
+INTEGER = "integer"
+CONTINUOUS = "continuous"
+
+# Constraint senses
+LESS_EQUAL = "<="
+EQUAL = "=="
+GREATER_EQUAL = ">="
+
+
+class Solver(object):
+    """Interface for building and solving a linear model"""
+
+    def __init__(self, name, threads=None):
+        self.name = name
+        self.threads = threads or config.THREADS
+
+    def add_var(self, name, vtype=CONTINUOUS):
+        """Add a variable (lower bound of zero) and return it"""
+        raise NotImplementedError()
+
+    def expression(self):
+        """Return an empty linear expression that supports +="""
+        raise NotImplementedError()
+
+    def quicksum(self, terms):
+        """Sum variables or expressions into one linear expression"""
+        raise NotImplementedError()
+
+    def linear_expression(self, coeffs, variables):
+        """Build sum(coeffs[i] * variables[i]) in one call"""
+        raise NotImplementedError()
+
+    def add_constr(self, lhs, sense, rhs):
+        """Add the constraint `lhs sense rhs`"""
+        raise NotImplementedError()
+
+    def set_objective(self, expr, maximize=True):
+        raise NotImplementedError()
+
+    def set_time_limit(self, seconds):
+        """Limit solve time. None removes the limit."""
+        raise NotImplementedError()
+
+    def set_bounds(self, var, lower, upper):
+        raise NotImplementedError()
+
+    def has_solution(self):
+        """Whether the last solve found any feasible solution"""
+        raise NotImplementedError()
+
+    def warm_start(self):
+        """Use the best solution of the last solve (if there is one) as the
+        start of the next solve. Return whether there was one."""
+        return False
+
+    def load_tuning(self, path):
+        """Load tuned parameters from a file. Return whether it worked."""
+        return False
+
+    def update(self):
+        """Flush pending changes to the model (if the backend buffers)"""
+        pass
+
+    def optimize(self):
+        """Solve the model. Return whether an optimal solution was found."""
+        raise NotImplementedError()
+
+    def status(self):
+        """Backend-specific status of the last solve, for logging"""
+        raise NotImplementedError()
+
+    def objective_value(self):
+        raise NotImplementedError()
+
+    def value(self, var):
+        """Value of a variable in the last solution"""
+        raise NotImplementedError()
+
+    def size(self):
+        """Return (variables, constraints, nonzeros) of the model"""
+        raise NotImplementedError()
+
+    def gap(self):
+        """Relative MIP gap of the last solve, or None if unknown"""
+        return None
+
+    @classmethod
+    def reset(cls):
+        """Drop anything the backend shares between models (like a server
+        connection), so the next model starts fresh"""
+        pass
+
+
+class GurobiSolver(Solver):
+    """Solve with Gurobi"""
+
+    def __init__(self, name, threads=None):
+        super(GurobiSolver, self).__init__(name, threads)
+
+        # Import Guorbi now so server connection doesn't go stale
+        # (importing triggers a server connection)
+        import gurobipy as grb
+        self.grb = grb
+        self.GRB = grb.GRB  # For easier constant access
+
+        self.senses = {
+            LESS_EQUAL: self.GRB.LESS_EQUAL,
+            EQUAL: self.GRB.EQUAL,
+            GREATER_EQUAL: self.GRB.GREATER_EQUAL,
+        }
+        self.vtypes = {
+            BINARY: self.GRB.BINARY,
+            INTEGER: self.GRB.INTEGER,
+            CONTINUOUS: self.GRB.CONTINUOUS,
+        }
+
+        self.model = grb.Model(name)
+        self.model.setParam("OutputFlag", False)  # Don't print gurobi logs
+        self.model.setParam("Threads", self.threads)
+
+    @classmethod
+    def reset(cls):
+        # Models share gurobi's default environment (and with it the token
+        # server connection). Don't import gurobipy just to reset it.
+        grb = sys.modules.get("gurobipy")
+        if grb is not None and hasattr(grb, "disposeDefaultEnv"):
+            grb.disposeDefaultEnv()
+
+    def add_var(self, name, vtype=CONTINUOUS):
+        return self.model.addVar(vtype=self.vtypes[vtype], name=name)
+
+    def expression(self):
+        return self.grb.LinExpr()
+
+    def quicksum(self, terms):
+        return self.grb.quicksum(terms)
+
+    def linear_expression(self, coeffs, variables):
+        return self.grb.LinExpr(list(coeffs), list(variables))
+
+    def add_constr(self, lhs, sense, rhs):
+        if isinstance(lhs, self.grb.QuadExpr):
+            return self.model.addQConstr(lhs, self.senses[sense], rhs)
+        return self.model.addConstr(lhs, self.senses[sense], rhs)
+
+    def set_objective(self, expr, maximize=True):
+        self.model.setObjective(expr)
+        if maximize:
+            self.model.modelSense = self.GRB.MAXIMIZE
+        else:
+            self.model.modelSense = self.GRB.MINIMIZE
+
+    def set_time_limit(self, seconds):
+        if seconds is None:
+            seconds = self.GRB.INFINITY
+        self.model.setParam("TimeLimit", seconds)
+
+    def set_bounds(self, var, lower, upper):
+        var.lb = lower
+        var.ub = upper
+
+    def has_solution(self):
+        return self.model.SolCount > 0
+
+    def warm_start(self):
+        if not self.has_solution():
+            return False
+
+        for var in self.model.getVars():
+            var.start = var.x
+        return True
+
+    def load_tuning(self, path):
+        try:
+            self.model.read(path)
+            return True
+        except:
+            return False
+
+    def update(self):
+        self.model.update()
+
+    def optimize(self):
+        self.model.optimize()
+        return self.model.status == self.GRB.status.OPTIMAL
+
+    def status(self):
+        return self.model.status
+
+    def objective_value(self):
+        return self.model.objVal
+
+    def value(self, var):
+        return var.x
+
+    def size(self):
+        return (self.model.NumVars,
+                self.model.NumConstrs + self.model.NumQConstrs,
+                self.model.NumNZs)
+
+    def gap(self):
+        try:
+            return self.model.MIPGap
+        except self.grb.GurobiError:
+            # No solution yet
+            return None
+
+
+class CbcSolver(Solver):
+    """Solve with the open-source COIN-OR CBC engine (through PuLP)"""
+
+    def __init__(self, name, threads=None):
+        super(CbcSolver, self).__init__(name, threads)
+
+        import pulp
+        self.pulp = pulp
+
+        self.vtypes = {
+            BINARY: (pulp.LpInteger, 1),
+            INTEGER: (pulp.LpInteger, None),
+            CONTINUOUS: (pulp.LpContinuous, None),
+        }
+
+        self.model = pulp.LpProblem(name, pulp.LpMaximize)
+        self.time_limit = None
+        self.use_warm_start = False
+
+    def add_var(self, name, vtype=CONTINUOUS):
+        cat, up_bound = self.vtypes[vtype]
+        return self.pulp.LpVariable(
+            name, lowBound=0, upBound=up_bound,
+            cat=cat)
+
+    def expression(self):
+        return self.pulp.LpAffineExpression()
+
+    def quicksum(self, terms):
+        return self.pulp.lpSum(terms)
+
+    def linear_expression(self, coeffs, variables):
+        return self.pulp.LpAffineExpression(zip(variables, coeffs))
+
+    def add_constr(self, lhs, sense, rhs):
+        if sense == LESS_EQUAL:
+            constraint = lhs <= rhs
+        elif sense == EQUAL:
+            constraint = lhs == rhs
+        elif sense == GREATER_EQUAL:
+            constraint = lhs >= rhs
+        else:
+            raise Exception("Unknown constraint sense %s" % sense)
+
+        self.model += constraint
+        return constraint
+
+    def set_objective(self, expr, maximize=True):
+        self.model.setObjective(expr)
+        if maximize:
+            self.model.sense = self.pulp.LpMaximize
+        else:
+            self.model.sense = self.pulp.LpMinimize
+
+    def set_time_limit(self, seconds):
+        self.time_limit = seconds
+
+    def set_bounds(self, var, lower, upper):
+        var.lowBound = lower
+        var.upBound = upper
+
+    def has_solution(self):
+        if not hasattr(self.model, "sol_status"):
+            # Older PuLP only reports solutions proven optimal
+            return self.model.status == self.pulp.LpStatusOptimal
+
+        found = (self.pulp.LpSolutionOptimal,
+                 self.pulp.LpSolutionIntegerFeasible)
+        return self.model.sol_status in found
+
+    def warm_start(self):
+        if not self.has_solution():
+            return False
+
+        for var in self.model.variables():
+            var.setInitialValue(var.varValue)
+        self.use_warm_start = True
+        return True
+
+    def command(self):
+        """Return the CBC command for the next solve"""
+        try:
+            return self.pulp.PULP_CBC_CMD(msg=False,
+                                          threads=self.threads,
+                                          timeLimit=self.time_limit,
+                                          warmStart=self.use_warm_start)
+        except TypeError:
+            # PuLP 2.0 (the last release for Python 2) names them differently
+            return self.pulp.PULP_CBC_CMD(msg=False,
+                                          threads=self.threads,
+                                          maxSeconds=self.time_limit,
+                                          mip_start=self.use_warm_start)
+
+    def optimize(self):
+        self.model.solve(self.command())
+        optimal = self.model.status == self.pulp.LpStatusOptimal
+
+        # Status is "optimal" for any integer solution when stopped at the
+        # time limit, so check the solution status too (if PuLP has one)
+        if hasattr(self.model, "sol_status"):
+            optimal = optimal and \
+                self.model.sol_status == self.pulp.LpSolutionOptimal
+        return optimal
+
+    def status(self):
+        return self.pulp.LpStatus[self.model.status]
+
+    def objective_value(self):
+        return self.pulp.value(self.model.objective)
+
+    def value(self, var):
+        return var.varValue
+
+    def size(self):
+        # Constraints map their variables to coefficients
+        constraints = self.model.constraints.values()
+        return (len(self.model.variables()), len(constraints),
+                sum(len(c) for c in constraints))
+
+
+SOLVERS = {"gurobi": GurobiSolver, "cbc": CbcSolver, }
+
+
+def get_solver(name, solver=None):
+    """Create a model called `name` with the configured (or given) backend"""
+    solver = solver or config.SOLVER
+    if solver not in SOLVERS:
+        raise Exception("Unknown solver %s" % solver)
+
+    logger.debug("Building model %s with %s" % (name, solver))
+    return SOLVERS[solver](name)
+
+
+def reset_solvers():
+    """Reset every backend, e.g. after a failed solve"""
+    for solver in SOLVERS.values():
+        solver.reset()
@@ -0,0 +1,184 @@
+"""
+Run several tasking workers in one container.
+
+Each worker is a process with its own Tasking loop, so one long solve
+doesn't hold up the rest of the queue. Solver threads (config.THREADS) are
+split between the workers so they don't oversubscribe the host.
+"""
+
+import multiprocessing
+import os
+import signal
+import time
+
+from mobius import config, logger
+from mobius.metrics import PREFIX, QueueRegistry, REGISTRY, \
+    start_metrics_server
+from mobius.tasking import Tasking
+
+
+def threads_per_worker(workers, threads=None):
+    """Solver threads each worker gets, at least one"""
+    threads = threads or config.THREADS
+    return max(1, threads // workers)
+
+
+class WorkerHealth(object):
+    """What a worker is doing, shared with the supervisor"""
+
+    def __init__(self):
+        self.heartbeat = multiprocessing.Value("d", time.time())
+        self.working = multiprocessing.Value("b", False)
+        self.completed = multiprocessing.Value("i", 0)
+        self.failed = multiprocessing.Value("i", 0)
+
+    def beat(self, working=False):
+        self.heartbeat.value = time.time()
+        self.working.value = working
+
+    def task_done(self, success):
+        if success:
+            self.completed.value += 1
+        else:
+            self.failed.value += 1
+        self.beat()
+
+    def report(self):
+        """Return health as a dict. While working, the heartbeat age is how
+        long the current task has been running."""
+        return {
+            "state": "working" if self.working.value else "idle",
+            "heartbeat_age_seconds": time.time() - self.heartbeat.value,
+            "completed": self.completed.value,
+            "failed": self.failed.value,
+        }
+
+
+def _run_worker(worker_id, threads, stop_event, health, registry):
+    """Entry point of a worker process"""
+    # The supervisor decides when to stop - finish the task in hand first
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    config.THREADS = threads
+    logger.info("Worker %s started with %s solver threads (pid %s)" %
+                (worker_id, threads, os.getpid()))
+    Tasking(stop_event=stop_event, health=health, registry=registry).server()
+    logger.info("Worker %s stopped" % worker_id)
+
+
+class Supervisor():
+    """Start workers, restart any that die, and stop them gracefully on
+    SIGTERM or SIGINT"""
+
+    def __init__(self, workers=None):
+        self.workers = workers or config.TASKING_WORKERS
+        self.threads = threads_per_worker(self.workers)
+        self.stop_event = multiprocessing.Event()
+        self.stop_requested = False
+        self.health = [WorkerHealth() for _ in range(self.workers)]
+        self.processes = [None] * self.workers
+        self.registry = QueueRegistry()  # Workers' task metrics
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._handle_signal)
+        signal.signal(signal.SIGINT, self._handle_signal)
+
+        logger.info("Starting %s workers with %s solver threads each" %
+                    (self.workers, self.threads))
+        self.registry.forward(REGISTRY)
+        if config.METRICS_PORT:
+            start_metrics_server(config.METRICS_PORT, self.render)
+        for worker_id in range(self.workers):
+            self._start_worker(worker_id)
+
+        while not self.stop_requested:
+            self._check_workers()
+            time.sleep(config.SUPERVISOR_CHECK_INTERVAL_SECONDS)
+
+        self._shutdown()
+
+    def health_report(self):
+        """Return a health dict per worker"""
+        reports = []
+        for worker_id, process in enumerate(self.processes):
+            report = self.health[worker_id].report()
+            report["worker"] = worker_id
+            report["alive"] = process is not None and process.is_alive()
+            reports.append(report)
+        return reports
+
+    def render(self):
+        """Return every worker's task metrics and health in the Prometheus
+        text format"""
+        return REGISTRY.render() + self.render_health()
+
+    def render_health(self):
+        """Return worker health in the Prometheus text format"""
+        gauges = [
+            ("worker_up", lambda r: int(r["alive"])),
+            ("worker_working", lambda r: int(r["state"] == "working")),
+            ("worker_heartbeat_age_seconds",
+             lambda r: r["heartbeat_age_seconds"]),
+            ("worker_completed", lambda r: r["completed"]),
+            ("worker_failed", lambda r: r["failed"]),
+        ]
+        reports = self.health_report()
+        lines = []
+        for name, value in gauges:
+            lines.append("# TYPE %s_%s gauge" % (PREFIX, name))
+            for report in reports:
+                lines.append('%s_%s{worker="%s"} %s' %
+                             (PREFIX, name, report["worker"], value(report)))
+        return "\n".join(lines) + "\n"
+
+    def _handle_signal(self, signum, frame):
+        # Setting stop_event here could deadlock on its lock, so just flag
+        logger.info("Received signal %s - stopping workers" % signum)
+        self.stop_requested = True
+
+    def _start_worker(self, worker_id):
+        process = multiprocessing.Process(
+            target=_run_worker,
+            name="mobius-worker-%s" % worker_id,
+            args=(worker_id, self.threads, self.stop_event,
+                  self.health[worker_id], self.registry))
+        process.start()
+        self.processes[worker_id] = process
+
+    def _check_workers(self):
+        for report in self.health_report():
+            if not report["alive"]:
+                logger.error("Worker %s died (exit code %s) - restarting" %
+                             (report["worker"],
+                              self.processes[report["worker"]].exitcode))
+                self._start_worker(report["worker"])
+            else:
+                logger.debug("Worker health: %s" % report)
+
+    def _shutdown(self):
+        """Wait for workers to finish their tasks, then kill stragglers"""
+        self.stop_event.set()
+        deadline = time.time() + config.TASKING_SHUTDOWN_TIMEOUT_SECONDS
+        for process in self.processes:
+            process.join(max(0, deadline - time.time()))
+
+        for worker_id, process in enumerate(self.processes):
+            if process.is_alive():
+                logger.error("Worker %s did not stop in time - killing" %
+                             worker_id)
+                os.kill(process.pid, signal.SIGKILL)
+                process.join()
+
+        logger.info("All workers stopped")
+
+
+def serve():
+    """Run the tasking server - in this process for one worker, otherwise
+    under a Supervisor"""
+    if config.TASKING_WORKERS > 1:
+        Supervisor().run()
+    else:
+        if config.METRICS_PORT:
+            start_metrics_server(config.METRICS_PORT)
+        Tasking().server()
@@ -1,18 +1,39 @@
+from collections import OrderedDict
 from time import sleep
 import traceback
 import os
+import sys
 
 import pytz
 import iso8601
-from staffjoy import Client, NotFoundException
+from staffjoy import NotFoundException
 
 from mobius import config, logger
-from mobius.employee import Employee
 from mobius.environment import Environment
 from mobius.assign import Assign
+from mobius.loader import RoleLoader
+from mobius.client import get_client, get_schedule, patch, reset_client, \
+    role_handle
+from mobius.concurrency import Backoff
+from mobius.metrics import Metrics
 from mobius.constants import MINUTES_PER_HOUR, UNASSIGNED_USER_ID
 from mobius.helpers import week_sum, dt_to_query_str
 from mobius.shift import Shift
+from mobius.solver import reset_solvers
+
+
+class LocationBatch():
+    """What the tasks of one location in a batch share"""
+
+    def __init__(self):
+        self.organization = None
+        self.location = None
+        self.roles = {}  # {role_id: role}
+        self.shifts = OrderedDict()  # {shift_id: Shift} fetched or assigned
+
+    def add_shifts(self, shifts):
+        for s in shifts:
+            self.shifts[s.shift_id] = s
 
 
 class Tasking():
@@ -20,23 +41,52 @@ class Tasking():
 
     REQUEUE_STATE = "mobius-queue"
 
-    def __init__(self):
-        self.client = Client(key=config.STAFFJOY_API_KEY, env=config.ENV)
+    def __init__(self,
+                 stop_event=None,
+                 health=None,
+                 wait_for_task=None,
+                 registry=None):
+        """stop_event, health and registry are set when running under a
+        Supervisor - the server finishes its current task and returns once
+        stop_event is set, reports what it's doing to health, and records
+        task metrics in registry (by default the process-wide one).
+
+        wait_for_task(seconds) is an optional long-poll/push hook called
+        instead of sleeping between empty polls. It should return early when
+        a task may have been queued, and no later than seconds.
+        """
+        self.client = get_client()
         self.default_tz = pytz.timezone(config.DEFAULT_TZ)
+        self.stop_event = stop_event
+        self.health = health
+        self.wait_for_task = wait_for_task
+        self.registry = registry
+        self.consecutive_failures = 0
+        self.batch = LocationBatch()
+        self.sched = None  # Schedule of the current task
+        self.schedules = {}  # {schedule_id: schedule} fetched while claiming
+
+        self.empty_backoff = Backoff(config.TASKING_MIN_FETCH_INTERVAL_SECONDS,
+                                     config.TASKING_FETCH_INTERVAL_SECONDS)
+        self.error_backoff = Backoff(config.TASKING_MIN_FETCH_INTERVAL_SECONDS,
+                                     config.TASKING_MAX_ERROR_INTERVAL_SECONDS)
 
     def server(self):
         previous_request_failed = False  # Have some built-in retries
 
-        while True:
-            # Get task
+        while not self._stopping():
+            self._beat()
+
+            # Get tasks
             try:
-                task = self.client.claim_mobius_task()
-                logger.info("Task received: %s" % task.data)
+                tasks = self._claim_tasks()
                 previous_request_failed = False
             except NotFoundException:
-                logger.debug("No task found. Sleeping.")
                 previous_request_failed = False
-                sleep(config.TASKING_FETCH_INTERVAL_SECONDS)
+                self.error_backoff.reset()
+                delay = self.empty_backoff.delay()
+                logger.debug("No task found. Sleeping %.1f seconds." % delay)
+                self._wait_for_task(delay)
                 continue
             except Exception as e:
                 if not previous_request_failed:
@@ -48,40 +98,232 @@ class Tasking():
                         "Unable to fetch mobius task after previous failure: %s"
                         % e)
 
-                # Still sleep so we avoid thundering herd
-                sleep(config.TASKING_FETCH_INTERVAL_SECONDS)
+                # Still sleep (with jitter) so we avoid thundering herd
+                self._sleep(self.error_backoff.delay())
                 continue
 
+            # Poll again straight after the tasks - more may be waiting
+            self.empty_backoff.reset()
+
+            if self._process_batch(tasks):
+                self.error_backoff.reset()
+            else:
+                # Don't claim a requeued task straight back
+                delay = self.error_backoff.delay()
+                logger.info("Batch failed. Sleeping %.1f seconds." % delay)
+                self._sleep(delay)
+
+    def _claim_tasks(self):
+        """Claim a task, then more for the same location and week while any
+        are queued - up to TASKING_BATCH_SIZE in all. A task for another
+        location or week ends the batch and goes back to the queue, so
+        another worker can take it."""
+        self.schedules = {}
+        tasks = [self.client.claim_mobius_task()]
+        logger.info("Task received: %s" % tasks[0].data)
+        if config.TASKING_BATCH_SIZE <= 1:
+            return tasks
+
+        try:
+            self._fetch_schedule(tasks[0])
+        except Exception as e:
+            # Process it on its own
+            logger.info("Unable to fetch schedule %s for a batch: %s" %
+                        (tasks[0].data.get("schedule_id"), e))
+            return tasks
+        key = self._batch_key(tasks[0])
+
+        while len(tasks) < config.TASKING_BATCH_SIZE:
             try:
-                self._process_task(task)
-                task.delete()
-                logger.info("Task completed %s" % task.data)
+                task = self.client.claim_mobius_task()
+            except NotFoundException:
+                break
             except Exception as e:
-                logger.error("Failed schedule %s:  %s %s" %
-                             (task.data.get("schedule_id"), e,
-                              traceback.format_exc()))
+                # Process what we have
+                logger.info("Unable to claim more tasks for the batch: %s" % e)
+                break
+            logger.info("Task received: %s" % task.data)
+
+            if self._location_key(task) == self._location_key(tasks[0]):
+                try:
+                    self._fetch_schedule(task)
+                except Exception as e:
+                    logger.info("Unable to fetch schedule %s for the batch: %s"
+                                % (task.data.get("schedule_id"), e))
+
+            if self._batch_key(task) != key:
+                self.sched = self.schedules.get(task.data.get("schedule_id"))
+                self._requeue(task)
+                break
+            tasks.append(task)
+
+        return tasks
+
+    def _fetch_schedule(self, task):
+        schedule = self._schedule_handle(task)
+        schedule.fetch()
+        self.schedules[task.data.get("schedule_id")] = schedule
+
+    @staticmethod
+    def _location_key(task):
+        return (task.data.get("organization_id"), task.data.get("location_id"))
+
+    def _batch_key(self, task):
+        """Location and (once its schedule is fetched) week of a task"""
+        schedule = self.schedules.get(task.data.get("schedule_id"))
+        week = schedule.data.get("start") if schedule is not None else None
+        return self._location_key(task) + (week, )
 
-                logger.info("Requeuing schedule %s" %
-                            task.data.get("schedule_id"))
+    def _process_batch(self, tasks):
+        """Process claimed tasks a location and week at a time, sharing api
+        objects (and with TASKING_BATCH_CROSS_ROLE, workers' shifts) between
+        their tasks. Recovery waits until every claimed task is done or
+        requeued. Once stopping, tasks not started yet are requeued. Return
+        whether every task succeeded."""
+        locations = OrderedDict()
+        for task in tasks:
+            locations.setdefault(self._batch_key(task), []).append(task)
 
+        failed = False
+        for location_tasks in locations.values():
+            self.batch = LocationBatch()
+            for task in location_tasks:
+                if self._stopping():
+                    # Don't start anything new - put it back in the queue
+                    self.sched = None
+                    self._requeue(task)
+                    continue
+
+                if not self._run_task(task, len(tasks)):
+                    failed = True
+                    # Don't share anything from a failure
+                    self.batch = LocationBatch()
+
+        if failed:
+            self._recover()
+        else:
+            self.consecutive_failures = 0
+        return not failed
+
+    def _run_task(self, task, batch_size):
+        """Process a task, returning whether it succeeded"""
+        self._beat(working=True)
+        metrics = Metrics(schedule_id=task.data.get("schedule_id"),
+                          role_id=task.data.get("role_id"))
+        metrics.set("batch_size", batch_size)
+        try:
+            with metrics.timer("total"):
+                self._process_task(task, metrics)
+                task.delete()
+            logger.info("Task completed %s" % task.data)
+            metrics.finish(True, self.registry)
+            self._task_done(True)
+            return True
+        except Exception as e:
+            metrics.finish(False, self.registry)
+            self._task_done(False)
+            logger.error("Failed schedule %s:  %s %s" %
+                         (task.data.get("schedule_id"), e,
+                          traceback.format_exc()))
+            self._requeue(task)
+            return False
+
+    def _requeue(self, task):
+        logger.info("Requeuing schedule %s" % task.data.get("schedule_id"))
+        try:
+            if self.sched is not None:
                 # self.sched set in process_task
                 self.sched.patch(state=self.REQUEUE_STATE)
+            else:
+                # Never fetched - patch it by id
+                patch(self._schedule_handle(task), state=self.REQUEUE_STATE)
+        except Exception as e:
+            logger.error("Unable to requeue schedule %s: %s" %
+                         (task.data.get("schedule_id"), e))
+
+    @staticmethod
+    def _schedule_handle(task):
+        return get_schedule(
+            role_handle(
+                task.data.get("organization_id"), task.data.get("location_id"),
+                task.data.get("role_id")), task.data.get("schedule_id"))
+
+    def _recover(self):
+        """Reset the solver and api client after a failure. Repeated failures
+        trip a circuit breaker that restarts instead (if KILL_ON_ERROR)."""
+        self.consecutive_failures += 1
+
+        if config.KILL_ON_ERROR and self.consecutive_failures >= \
+                config.RECOVERY_MAX_CONSECUTIVE_FAILURES:
+            self._restart()
+            return
+
+        # For example, if a Gurobi connection is drained then a fresh
+        # environment helps
+        logger.info("Resetting solver and api client after %s failure(s)" %
+                    self.consecutive_failures)
+        reset_solvers()
+        reset_client()
+        self.client = get_client()
+
+    def _restart(self):
+        sleep(config.KILL_DELAY)  # To prevent infinite loop
 
-                # Sometimes rebooting Mobius helps with errors. For example, if
-                # a Gurobi connection is drained then it helps to reboot.
-                if config.KILL_ON_ERROR:
-                    sleep(config.KILL_DELAY)
-                    logger.info("Rebooting to kill container")
-                    os.system("shutdown -r now")
+        if self.stop_event is not None:
+            # Supervised - it starts a new worker
+            logger.info("Exiting worker after %s failures in a row" %
+                        self.consecutive_failures)
+            sys.exit(1)
 
-    def _process_task(self, task):
+        logger.info("Rebooting to kill container")
+        os.system("shutdown -r now")
 
-        # 1. Fetch schedule
-        self.org = self.client.get_organization(task.data.get(
-            "organization_id"))
-        self.loc = self.org.get_location(task.data.get("location_id"))
-        self.role = self.loc.get_role(task.data.get("role_id"))
-        self.sched = self.role.get_schedule(task.data.get("schedule_id"))
+    def _stopping(self):
+        return self.stop_event is not None and self.stop_event.is_set()
+
+    def _sleep(self, seconds):
+        """Sleep, but wake up to stop"""
+        if self.stop_event is not None:
+            self.stop_event.wait(seconds)
+        else:
+            sleep(seconds)
+
+    def _wait_for_task(self, seconds):
+        if self.wait_for_task is not None:
+            self.wait_for_task(seconds)
+        else:
+            self._sleep(seconds)
+
+    def _beat(self, working=False):
+        if self.health is not None:
+            self.health.beat(working)
+
+    def _task_done(self, success):
+        if self.health is not None:
+            self.health.task_done(success)
+
+    def _process_task(self, task, metrics):
+        batch = self.batch
+        self.sched = None  # Not another task's, if fetching fails
+
+        # 1. Fetch schedule - the organization, location and role only once
+        # per batch
+        with metrics.timer("fetch"):
+            if batch.location is None:
+                batch.organization = self.client.get_organization(
+                    task.data.get("organization_id"))
+                batch.location = batch.organization.get_location(task.data.get(
+                    "location_id"))
+            self.org = batch.organization
+            self.loc = batch.location
+
+            role_id = task.data.get("role_id")
+            if role_id not in batch.roles:
+                batch.roles[role_id] = self.loc.get_role(role_id)
+            self.role = batch.roles[role_id]
+            schedule_id = task.data.get("schedule_id")
+            self.sched = self.schedules.pop(schedule_id, None) or \
+                self.role.get_schedule(schedule_id)
 
         env = Environment(
             organization_id=task.data.get("organization_id"),
@@ -101,41 +343,52 @@ class Tasking():
             max_consecutive_workdays=self.role.data.get(
                 "max_consecutive_workdays"))
 
-        user_objs = self.role.get_workers(archived=False)
-        employees = []
-        for e in user_objs:
-            new_e = Employee(
-                user_id=e.data["id"],
-                min_hours_per_workweek=e.data["min_hours_per_workweek"],
-                max_hours_per_workweek=e.data["max_hours_per_workweek"],
-                environment=env, )
+        loader = RoleLoader(self.role, self.sched, env)
+        with metrics.timer("fetch"):
+            loader.fetch()
 
-            # check whether employee even has availability to work
-            if week_sum(new_e.availability) > new_e.min_hours_per_workweek:
-                employees.append(new_e)
+        if config.TASKING_BATCH_CROSS_ROLE:
+            # Shifts from the batch's other roles become workers' history
+            loader.add_shifts(batch.shifts.values())
+            batch.add_shifts(s
+                             for user_shifts in loader.shifts.values()
+                             for s in user_shifts)
+
+        employees = []
+        with metrics.timer("employees"):
+            for e in loader.build_employees():
+                # check whether employee even has availability to work
+                if week_sum(e.availability) > e.min_hours_per_workweek:
+                    employees.append(e)
+        metrics.set("employees", len(employees))
 
         if len(employees) is 0:
             logger.info("No employees")
             return
 
         # Get the shifts
-        shift_api_objs = self.role.get_shifts(start=dt_to_query_str(env.start),
-                                              end=dt_to_query_str(env.stop),
-                                              user_id=UNASSIGNED_USER_ID)
+        with metrics.timer("fetch"):
+            shift_api_objs = self.role.get_shifts(
+                start=dt_to_query_str(env.start),
+                end=dt_to_query_str(env.stop),
+                user_id=UNASSIGNED_USER_ID)
 
         # Convert api objs to something more manageable
         shifts = []
         for s in shift_api_objs:
             shifts.append(Shift(s))
 
+        metrics.set("shifts", len(shifts))
+
         if len(shifts) is 0:
             logger.info("No unassigned shifts")
             return
 
         # Run the  calculation
-        a = Assign(env, employees, shifts)
+        a = Assign(env, employees, shifts, role=self.role, metrics=metrics)
         a.calculate()
         a.set_shift_user_ids()
+        batch.add_shifts(a.shifts)
 
     def _get_local_start_time(self):
         # Create the datetimes
@@ -1,5 +1,6 @@
 import os
 import json
+import time
 from copy import deepcopy
 
 from mobius.assign import Assign
@@ -9,10 +10,8 @@ from mobius.environment import Environment
 from mobius import config, logger
 
 
-def tune():
-    """Take a canonical decomposition model, then tune it using Gurobi"""
-
-    logger.info("Beginning tuning")
+def tuning_assignment(solver="gurobi"):
+    """Build the canonical assignment problem from tune_data"""
 
     # Creating some employees
 
@@ -145,7 +144,6 @@ def tune():
 
     with open(os.path.dirname(os.path.realpath(__file__)) +
               "/tune_data/shifts.json") as json_data:
-        print json_data
         shifts_raw = json.load(json_data)
         json_data.close()
 
@@ -153,7 +151,16 @@ def tune():
     for s in shifts_raw:
         shifts.append(Shift(s))
 
-    a = Assign(env, employees, shifts)
+    return Assign(env, employees, shifts, solver=solver)
+
+
+def tune():
+    """Take a canonical decomposition model, then tune it using Gurobi"""
+
+    logger.info("Beginning tuning")
+
+    # Tuning is Gurobi-specific
+    a = tuning_assignment(solver="gurobi")
 
     model = a._calculate(return_unsolved_model_for_tuning=True)
 
@@ -181,3 +188,26 @@ def tune():
         model.optimize()
     else:
         logger.warning("No tuning completed")
+
+
+def benchmark_consecutive_days_off(solver="gurobi"):
+    """Compare solve time of the quadratic and linearized consecutive days
+    off formulations on the tune_data instance"""
+
+    results = {}
+    for formulation in ["quadratic", "linear"]:
+        a = tuning_assignment(solver=solver)
+        a.linear_days_off = formulation == "linear"
+
+        start = time.time()
+        try:
+            a._calculate(consecutive_days_off=True)
+            status = "solved"
+        except Exception as e:
+            status = "failed (%s)" % e
+        results[formulation] = time.time() - start
+
+        logger.info("%s consecutive days off: %s in %.2f seconds" %
+                    (formulation, status, results[formulation]))
+
+    return results
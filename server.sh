@@ -1,5 +1,5 @@
 #!/bin/bash
 set -e
 
-python -c "from mobius import Tasking; t = Tasking(); t.server()"
+python -c "from mobius.supervisor import serve; serve()"
 exit 1
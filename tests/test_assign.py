@@ -0,0 +1,275 @@
+"""
+Test the Assign object
+"""
+
+import multiprocessing
+import os
+import shutil
+import signal
+import tempfile
+import unittest
+from datetime import timedelta
+
+from mobius import Assign, Employee, Environment, config
+from mobius import assign as assign_module
+from mobius.assign import loosest_stage
+from mobius.constants import HOURS_PER_DAY
+from mobius.helpers import dt_overlaps, week_day_range
+from mobius.shift import Shift
+
+
+def calculate_ignoring_signals(assign, processes, results):
+    """Calculate like a supervised worker, which ignores SIGTERM/SIGINT"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    config.DECOMPOSE_PROCESSES = processes
+    assign.calculate(decompose=True)
+    results.put([s.user_id for s in assign.shifts])
+
+
+class TestAssign(unittest.TestCase):
+    """ Test the model building helpers of the assign class """
+
+    def setUp(self):
+        self.env_attributes = {
+            "organization_id": 7,
+            "location_id": 8,
+            "role_id": 4,
+            "schedule_id": 9,
+            "tz_string": "America/Los_Angeles",
+            "start": "2015-12-21T08:00:00",
+            "stop": "2015-12-28T08:00:00",
+            "day_week_starts": "monday",
+            "min_minutes_per_workday": 60 * 5,
+            "max_minutes_per_workday": 60 * 8,
+            "min_minutes_between_shifts": 60 * 12,
+            "max_consecutive_workdays": 6,
+        }
+        self.env = Environment(**self.env_attributes)
+
+        # Start/stop tuples
+        start_stops = [
+            ("2015-12-21T16:00:00", "2015-12-21T21:00:00"),
+            ("2015-12-21T16:00:00", "2015-12-22T01:00:00"),
+            ("2015-12-21T20:00:00", "2015-12-22T04:00:00"),
+            ("2015-12-22T10:00:00", "2015-12-22T16:00:00"),
+            ("2015-12-22T16:00:00", "2015-12-22T20:00:00"),
+            ("2015-12-23T16:00:00", "2015-12-23T21:00:00"),
+            ("2015-12-25T08:00:00", "2015-12-25T12:00:00"),
+        ]
+        self.shifts = []
+        for shift_id, (start, stop) in enumerate(start_stops):
+            self.shifts.append(Shift({
+                "id": shift_id,
+                "user_id": 0,
+                "start": start,
+                "stop": stop,
+            }))
+
+    def create_assign(self):
+        self.assign = Assign(self.env, [], self.shifts)
+
+    def create_employee(self, user_id, days):
+        """A worker available all day on days"""
+        working_hours = dict((day, [int(day in days)] * HOURS_PER_DAY)
+                             for day in week_day_range())
+        return Employee(user_id=user_id,
+                        min_hours_per_workweek=0,
+                        max_hours_per_workweek=40,
+                        preferences=working_hours,
+                        working_hours=working_hours,
+                        time_off_requests=[],
+                        preceding_day_worked=False,
+                        preceding_days_worked_streak=0,
+                        existing_shifts=[],
+                        environment=self.env)
+
+    def create_split_assign(self):
+        # Workers 1 and 3 share monday, worker 2 only works wednesday and
+        # nobody can work friday
+        self.assign = Assign(
+            self.env,
+            [
+                self.create_employee(1, ["monday", "tuesday"]),
+                self.create_employee(2, ["wednesday"]),
+                self.create_employee(3, ["monday"]),
+            ],
+            self.shifts,
+            solver="cbc")
+
+    def brute_force_conflicts(self):
+        """The original all-pairs check, as unordered shift id pairs"""
+        buffer = timedelta(minutes=self.env.min_minutes_between_shifts)
+        conflicts = set()
+        for test in self.shifts:
+            for o in self.shifts:
+                if o.shift_id == test.shift_id:
+                    continue
+                if dt_overlaps(o.start, o.stop, test.start,
+                               test.stop + buffer):
+                    conflicts.add(frozenset([test.shift_id, o.shift_id]))
+        return conflicts
+
+    def clique_pairs(self, cliques):
+        """All unordered shift id pairs covered by the cliques"""
+        pairs = set()
+        for clique in cliques:
+            for a in clique:
+                for b in clique:
+                    if a.shift_id != b.shift_id:
+                        pairs.add(frozenset([a.shift_id, b.shift_id]))
+        return pairs
+
+    def test_shift_cliques_cover_exactly_the_conflicts(self):
+        expected = self.brute_force_conflicts()
+        self.create_assign()
+
+        cliques = self.assign._shift_cliques()
+        # Every conflict is in a clique, and every clique is a conflict
+        assert self.clique_pairs(cliques) == expected
+
+    def test_shift_cliques_are_maximal(self):
+        self.create_assign()
+        conflicts = self.brute_force_conflicts()
+
+        cliques = self.assign._shift_cliques()
+        assert len(cliques) > 0
+        for clique in cliques:
+            assert len(clique) > 1
+            members = set(s.shift_id for s in clique)
+            for s in self.shifts:
+                if s.shift_id in members:
+                    continue
+                # No outside shift conflicts with the whole clique
+                assert not all(frozenset([s.shift_id, m]) in conflicts
+                               for m in members)
+
+    def test_shift_cliques_without_buffer(self):
+        self.env.min_minutes_between_shifts = 0
+        expected = self.brute_force_conflicts()
+        self.create_assign()
+
+        assert self.clique_pairs(self.assign._shift_cliques()) == expected
+
+    def test_set_shift_user_ids_only_patches_changes(self):
+        self.shifts[1].user_id = 5
+        self.shifts[2].user_id = 6
+        self.shifts[3].user_id = 7
+        self.shifts[3].original_user_id = 7  # Already in the api
+        self.create_assign()
+
+        patched = []
+        self.assign._patch_shift = lambda role, shift: patched.append(shift.shift_id)
+        self.assign.role = object()
+        self.assign.set_shift_user_ids()
+
+        assert sorted(patched) == [1, 2]
+
+    def test_components(self):
+        self.create_split_assign()
+        components = [(sorted(e.user_id for e in employees),
+                       sorted(s.shift_id for s in shifts))
+                      for employees, shifts in self.assign.components()]
+
+        assert components == [([1, 3], [0, 1, 2, 3, 4]), ([2], [5])]
+
+    def test_calculate_components_matches_whole_model(self):
+        self.create_split_assign()
+        self.assign.calculate(decompose=False)
+        whole = [s.user_id for s in self.shifts]
+
+        previous_processes = config.DECOMPOSE_PROCESSES
+        for processes in [1, 2]:
+            config.DECOMPOSE_PROCESSES = processes
+            try:
+                for s in self.shifts:
+                    s.user_id = 0
+                self.create_split_assign()
+                self.assign.calculate(decompose=True)
+            finally:
+                config.DECOMPOSE_PROCESSES = previous_processes
+
+            assert self.assign.metrics.values["components"] == 2
+            assert self.assign.metrics.values["stage"] is not None
+            assert len([s for s in self.shifts if s.user_id]) == \
+                len([u for u in whole if u])
+            assert self.shifts[5].user_id == 2
+            assert self.shifts[6].user_id == 0
+
+    def test_components_solved_in_process_by_default(self):
+        # Each spawned process would take another Gurobi license token
+        def map_processes(processes, jobs):
+            raise Exception("Started a process pool")
+
+        self.create_split_assign()
+        self.assign._map_processes = map_processes
+        self.assign.calculate(decompose=True)
+
+        assert self.assign.metrics.values["components"] == 2
+        assert self.shifts[5].user_id == 2
+
+    def test_calculate_components_with_signals_ignored(self):
+        self.create_split_assign()
+        results = multiprocessing.Queue()
+        process = multiprocessing.Process(target=calculate_ignoring_signals,
+                                          args=(self.assign, 2, results))
+        process.start()
+        try:
+            user_ids = results.get(timeout=60)
+            process.join(30)
+            assert not process.is_alive()
+            assert process.exitcode == 0
+        finally:
+            if process.is_alive():
+                # SIGTERM is ignored
+                process.kill()
+                process.join()
+
+        assert user_ids[5] == 2
+
+    def test_incidence_built_once(self):
+        built = []
+
+        class CountingIncidence(assign_module.Incidence):
+            def __init__(self, *args):
+                built.append(args)
+                super(CountingIncidence, self).__init__(*args)
+
+        # One component, so the model is built from the same incidence
+        self.create_split_assign()
+        self.assign.employees = self.assign.employees[:1]
+        previous_incidence = assign_module.Incidence
+        assign_module.Incidence = CountingIncidence
+        try:
+            self.assign.calculate(decompose=True)
+        finally:
+            assign_module.Incidence = previous_incidence
+
+        assert len(built) == 1
+
+    def test_component_profiles_are_named_apart(self):
+        directory = tempfile.mkdtemp()
+        previous = (config.PROFILE_MODEL_BUILD, config.PROFILE_DIR,
+                    config.DECOMPOSE_PROCESSES)
+        config.PROFILE_MODEL_BUILD = True
+        config.PROFILE_DIR = directory
+        config.DECOMPOSE_PROCESSES = 1
+        try:
+            self.create_split_assign()
+            self.assign.calculate(decompose=True)
+            names = sorted(os.listdir(directory))
+        finally:
+            config.PROFILE_MODEL_BUILD, config.PROFILE_DIR, \
+                config.DECOMPOSE_PROCESSES = previous
+            shutil.rmtree(directory)
+
+        base = "mobius-%s-role-4-9-component-" % config.ENV
+        assert names == [base + "0.folded", base + "0.prof", base + "1.folded",
+                         base + "1.prof"]
+
+    def test_loosest_stage(self):
+        strict = "consecutive_days_off_with_happiness"
+        loose = "no_consecutive_days_off_without_happiness"
+        assert loosest_stage(None, strict) == strict
+        assert loosest_stage(loose, strict) == loose
+        assert loosest_stage(strict, "soft") == "soft"
@@ -0,0 +1,61 @@
+"""
+Test the synthetic scenarios and benchmark runner
+"""
+
+import json
+import unittest
+
+from mobius.benchmark import Scenario, measure, run
+
+
+class TestBenchmark(unittest.TestCase):
+    def test_scenario_is_deterministic(self):
+        def describe(scenario):
+            environment, employees, shifts = scenario.build()
+            return ([(s.start, s.stop) for s in shifts],
+                    [(e.min_hours_per_workweek, e.availability)
+                     for e in employees])
+
+        scenario = Scenario(employees=4, shifts=12, seed=3)
+        assert describe(scenario) == describe(Scenario(
+            employees=4, shifts=12, seed=3))
+        assert describe(scenario) != describe(Scenario(
+            employees=4, shifts=12, seed=4))
+
+    def test_scenario_parameters(self):
+        environment, employees, shifts = Scenario(
+            employees=6, shifts=30,
+            overlap=1, availability=0).build()
+        assert len(employees) == 6
+        assert len(shifts) == 30
+        # Full overlap - every shift starts at once
+        assert len(set(s.start for s in shifts)) == 1
+        for e in employees:
+            assert e.availability_mask == 0
+
+    def test_scenario_names_differ(self):
+        scenarios = [Scenario(), Scenario(seed=1),
+                     Scenario(tz_string="Europe/London"),
+                     Scenario(time_off_rate=0.5)]
+        assert len(set(s.name() for s in scenarios)) == len(scenarios)
+
+    def test_measure(self):
+        result = measure(
+            Scenario(employees=3, shifts=8),
+            solve=True,
+            repeat=2,
+            time_limit=10)
+
+        assert len(result["build_seconds"]) == 2
+        assert len(result["solve_seconds"]) == 2
+        assert result["variables"] > 0
+        assert "build_coverage" in result["build_families"]
+        # Day sums are timed apart from the weekly hours
+        assert "build_day_sums" in result["build_families"]
+        assert "build_week" in result["build_families"]
+        assert result["solved"]
+
+    def test_report_is_json(self):
+        report = run([Scenario(employees=2, shifts=4)])
+        assert json.loads(json.dumps(report))["results"][0]["scenario"] == \
+            "e2-s4-o0.5-a0.8-t0.1-America/Los_Angeles-r0"
@@ -0,0 +1,196 @@
+"""
+Test solving assignment problems end to end
+"""
+
+import unittest
+from datetime import datetime, timedelta
+
+import pytest
+
+from mobius import Assign, Employee, Environment, config
+from mobius.constants import HOURS_PER_DAY
+from mobius.helpers import week_day_range
+from mobius.solver import GREATER_EQUAL
+from mobius.shift import Shift
+
+WEEK_START = datetime(2015, 12, 21, 8)  # Monday midnight in Los Angeles
+DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+
+class NoDaysOffAssign(Assign):
+    """Makes every stage requiring consecutive days off infeasible, and
+    records how the stages use the model"""
+
+    builds = 0
+
+    def _build_model(self, tuning=False):
+        self.builds += 1
+        super(NoDaysOffAssign, self)._build_model(tuning)
+
+        self.warm_starts = []
+        warm_start = self.model.warm_start
+
+        def record_warm_start():
+            self.warm_starts.append(warm_start())
+            return self.warm_starts[-1]
+
+        self.model.warm_start = record_warm_start
+
+    def _add_consecutive_days_off_constraints(self):
+        super(NoDaysOffAssign, self)._add_consecutive_days_off_constraints()
+        for violation in self.days_off_violation.values():
+            self.model.add_constr(violation, GREATER_EQUAL, 1)
+
+
+class TimedOutAssign(NoDaysOffAssign):
+    """The first stage finds a solution but stops short of optimal, like at
+    the happiness time limit"""
+
+    def _add_consecutive_days_off_constraints(self):
+        Assign._add_consecutive_days_off_constraints(self)
+
+    def _solve(self, accept_incumbent=False):
+        if not self.warm_starts:
+            self.model.optimize()
+            raise Exception("Calculation failed")
+        super(TimedOutAssign, self)._solve(accept_incumbent)
+
+
+class TestCalculate(unittest.TestCase):
+    """One worker who can work a shift every day of the week"""
+
+    CONFIG = ["SOFT_CONSTRAINTS", "CONSECUTIVE_DAYS_OFF_VIOLATION_PENALTY"]
+
+    def setUp(self):
+        self.previous_config = dict((name, getattr(config, name))
+                                    for name in self.CONFIG)
+
+        self.env = Environment(
+            organization_id=7,
+            location_id=8,
+            role_id=4,
+            schedule_id=9,
+            tz_string="America/Los_Angeles",
+            start=WEEK_START.strftime(DATETIME_FORMAT),
+            stop=(WEEK_START + timedelta(days=7)).strftime(DATETIME_FORMAT),
+            day_week_starts="monday",
+            min_minutes_per_workday=60 * 4,
+            max_minutes_per_workday=60 * 8,
+            min_minutes_between_shifts=60 * 10,
+            max_consecutive_workdays=6)
+
+        # 8am to 2pm local
+        self.shifts = []
+        for day in range(7):
+            start = WEEK_START + timedelta(days=day, hours=8)
+            self.shifts.append(Shift({
+                "id": day,
+                "user_id": 0,
+                "start": start.strftime(DATETIME_FORMAT),
+                "stop": (start + timedelta(hours=6)).strftime(DATETIME_FORMAT),
+            }))
+
+    def tearDown(self):
+        for name, value in self.previous_config.items():
+            setattr(config, name, value)
+
+    def create_assign(self,
+                      preceding_day_worked=True,
+                      solver="cbc",
+                      assign_class=Assign):
+        hours = dict((day, [1] * HOURS_PER_DAY) for day in week_day_range())
+        employee = Employee(user_id=1,
+                            min_hours_per_workweek=0,
+                            max_hours_per_workweek=60,
+                            preferences=hours,
+                            working_hours=hours,
+                            time_off_requests=[],
+                            preceding_day_worked=preceding_day_worked,
+                            preceding_days_worked_streak=0,
+                            existing_shifts=[],
+                            environment=self.env)
+
+        self.assign = assign_class(self.env, [employee],
+                                   self.shifts,
+                                   solver=solver)
+
+    def worked(self):
+        """Which days the worker was assigned"""
+        return [int(s.user_id == 1) for s in self.shifts]
+
+    def calculate(self, preceding_day_worked=True):
+        self.create_assign(preceding_day_worked)
+        self.assign.calculate(decompose=False)
+        return self.worked()
+
+    def strict_stage(self, preceding_day_worked, solver, linear):
+        """Solve only the stage requiring consecutive days off"""
+        self.create_assign(preceding_day_worked, solver)
+        self.assign.linear_days_off = linear
+        self.assign._calculate(consecutive_days_off=True)
+        return self.worked()
+
+    def check_days_off(self, solver, linear):
+        worked = self.strict_stage(True, solver, linear)
+        assert sum(worked) == 5
+        self.assert_consecutive_days_off(worked)
+
+        # Not working the day before the week pairs with a first day off
+        for s in self.shifts:
+            s.user_id = 0
+        assert self.strict_stage(False, solver, linear) == [0] + [1] * 6
+
+    def test_consecutive_days_off(self):
+        self.check_days_off("cbc", linear=True)
+
+    def test_consecutive_days_off_quadratic(self):
+        # CBC can't multiply variables - only Gurobi solves this form
+        pytest.importorskip("gurobipy")
+        self.check_days_off("gurobi", linear=False)
+
+    def assert_consecutive_days_off(self, worked):
+        assert any(not (a or b) for a, b in zip(worked, worked[1:]))
+
+    def test_soft_keeps_days_off_before_coverage(self):
+        config.SOFT_CONSTRAINTS = True
+        worked = self.calculate()
+
+        assert sum(worked) == 5
+        self.assert_consecutive_days_off(worked)
+        assert self.assign.metrics.values["stage"] == "soft"
+
+    def test_soft_matches_staged_coverage(self):
+        staged = self.calculate()
+        for s in self.shifts:
+            s.user_id = 0
+
+        config.SOFT_CONSTRAINTS = True
+        assert sum(self.calculate()) == sum(staged)
+
+    def test_soft_penalty_trades_days_off_for_coverage(self):
+        config.SOFT_CONSTRAINTS = True
+        config.CONSECUTIVE_DAYS_OFF_VIOLATION_PENALTY = -100
+
+        assert self.calculate() == [1] * 7
+
+    def test_stages_fall_back_on_one_model(self):
+        self.create_assign(assign_class=NoDaysOffAssign)
+        self.assign.calculate(decompose=False)
+
+        assert self.assign.builds == 1
+        # Both days off stages failed, each trying to warm start the next
+        assert len(self.assign.warm_starts) == 2
+        assert self.assign.metrics.values["stage"] == \
+            "no_consecutive_days_off_without_happiness"
+        # Days off are no longer required, so every shift is covered
+        assert self.worked() == [1] * 7
+
+    def test_failed_stage_warm_starts_the_next(self):
+        self.create_assign(assign_class=TimedOutAssign)
+        self.assign.calculate(decompose=False)
+
+        assert self.assign.warm_starts == [True]
+        assert self.assign.model.use_warm_start  # Passed on to CBC
+        assert self.assign.metrics.values["stage"] == \
+            "consecutive_days_off_without_happiness"
+        assert sum(self.worked()) == 5
@@ -0,0 +1,73 @@
+"""
+Test the process-wide api client
+"""
+
+import unittest
+
+import requests
+
+from staffjoy import resource
+
+from mobius import Environment
+from mobius.client import get_client, get_role, get_schedule, get_shift, \
+    patch, role_handle, SessionRequests
+
+
+class TestClient(unittest.TestCase):
+    def setUp(self):
+        self.env = Environment(organization_id=7,
+                               location_id=8,
+                               role_id=4,
+                               schedule_id=9,
+                               tz_string="America/Los_Angeles",
+                               start="2015-12-21T08:00:00",
+                               stop="2015-12-28T08:00:00",
+                               day_week_starts="monday",
+                               min_minutes_per_workday=60 * 5,
+                               max_minutes_per_workday=60 * 8,
+                               min_minutes_between_shifts=60 * 12,
+                               max_consecutive_workdays=6, )
+
+    def test_one_client(self):
+        assert get_client() is get_client()
+        assert isinstance(resource.requests, SessionRequests)
+        # staffjoy still reads status codes from it
+        assert resource.requests.codes.ok == 200
+
+    def test_role_handle(self):
+        role = get_role(self.env)
+        assert role.data == {}
+        assert role._url().endswith("organizations/7/locations/8/roles/4")
+
+    def test_schedule_handle(self):
+        schedule = get_schedule(role_handle(7, 8, 4), 9)
+        assert schedule._url().endswith(
+            "organizations/7/locations/8/roles/4/schedules/9")
+
+    def test_patch_without_refetch(self):
+        sent = []
+
+        class FakeRequests:
+            codes = requests.codes
+
+            def patch(self, url, **kwargs):
+                sent.append((url, kwargs["data"]))
+                response = requests.Response()
+                response.status_code = 200
+                return response
+
+            def get(self, url, **kwargs):
+                raise AssertionError("Should not refetch")
+
+        shift = get_shift(get_role(self.env), 12)
+        session_requests = resource.requests
+        resource.requests = FakeRequests()
+        try:
+            patch(shift, user_id=3)
+        finally:
+            resource.requests = session_requests
+
+        assert len(sent) == 1
+        assert sent[0][0].endswith("roles/4/shifts/12")
+        assert sent[0][1] == {"user_id": 3}
+        assert shift.data["user_id"] == 3
@@ -0,0 +1,81 @@
+"""
+Test running api calls concurrently with retries
+"""
+
+import threading
+import time
+import unittest
+
+import requests
+from staffjoy.exceptions import NotFoundException
+
+from mobius import config
+from mobius.concurrency import run_concurrently, call_with_retries, \
+    Backoff
+
+
+class FlakyCall:
+    """Fails with error the first failures times it is called"""
+
+    def __init__(self, failures, error):
+        self.failures = failures
+        self.error = error
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error
+        return self.calls
+
+
+class TestConcurrency(unittest.TestCase):
+    def setUp(self):
+        self.backoff = config.API_RETRY_BACKOFF_SECONDS
+        config.API_RETRY_BACKOFF_SECONDS = 0
+
+    def tearDown(self):
+        config.API_RETRY_BACKOFF_SECONDS = self.backoff
+
+    def test_results_in_order(self):
+        functions = [lambda i=i: i * i for i in range(20)]
+        assert run_concurrently(functions) == [i * i for i in range(20)]
+
+    def test_bounded(self):
+        lock = threading.Lock()
+        running = [0, 0]  # now, max
+
+        def call():
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+
+        run_concurrently([call] * 12, concurrency=3)
+        assert 1 < running[1] <= 3
+
+    def test_retries_temporary_errors(self):
+        call = FlakyCall(2, requests.exceptions.ConnectionError())
+        assert call_with_retries(call) == 3
+
+    def test_gives_up(self):
+        call = FlakyCall(config.API_RETRIES + 1, requests.exceptions.Timeout())
+        with self.assertRaises(requests.exceptions.Timeout):
+            call_with_retries(call)
+        assert call.calls == config.API_RETRIES + 1
+
+    def test_no_retry_on_client_errors(self):
+        call = FlakyCall(1, NotFoundException())
+        with self.assertRaises(NotFoundException):
+            run_concurrently([call, call])
+
+    def test_backoff(self):
+        backoff = Backoff(1, 8)
+        delays = [backoff.delay() for _ in range(6)]
+        for delay, cap in zip(delays, [1, 2, 4, 8, 8, 8]):
+            assert cap / 2.0 <= delay <= cap
+
+        backoff.reset()
+        assert backoff.delay() <= 1
@@ -163,7 +163,9 @@ class TestEmployee(unittest.TestCase):
         assert self.employee.available_to_work(s) == True
 
         # Make a quick swap
-        self.employee.availability["tuesday"][23] = 0
+        availability = self.employee.availability
+        availability["tuesday"][23] = 0
+        self.employee.availability = availability
         assert self.employee.available_to_work(s) == False
 
     def test_available_to_work_working_hours_mixed_days_unavailable(self):
@@ -395,3 +397,33 @@ class TestEmployee(unittest.TestCase):
         assert self.employee.availability[
             "wednesday"] == self.employee_attributes["working_hours"][
                 "wednesday"]
+
+    def test_available_to_work_does_not_change_shift(self):
+        self.create_employee()
+        shift_src = {
+            "id": 2718,
+            "start": "2015-12-22T07:00:00-08:00",
+            "stop": "2015-12-23T02:00:00-08:00",
+            "user_id": 0,  # It's not assigned yeeeeet
+        }
+        s = Shift(shift_src)
+        start, stop = s.start, s.stop
+
+        self.employee.available_to_work(s)
+        assert s.start is start
+        assert s.stop is stop
+
+    def test_availability_mask_is_cached(self):
+        self.create_employee()
+        mask = self.employee.availability_mask
+
+        # Reading working hours keeps the mask
+        availability = self.employee.availability
+        assert self.employee.availability_mask is mask
+
+        # Assigning them rebuilds it
+        availability["monday"] = [0] * HOURS_PER_DAY
+        self.employee.availability = availability
+        assert self.employee.availability_mask != mask
+        assert self.employee.availability_mask & (
+            (1 << HOURS_PER_DAY) - 1) == 0
@@ -3,7 +3,8 @@ from datetime import datetime
 import pytz
 import pytest
 
-from mobius.helpers import week_day_range, normalize_to_midnight
+from mobius.helpers import week_day_range, normalize_to_midnight, \
+    week_range_all_true, week_to_mask, hours_to_mask
 from .helpers import ApiSpoof
 
 
@@ -36,3 +37,19 @@ def test_normalize_to_midnight():
         1990, 12, 9, 0,
         0, 0, tzinfo=pytz.timezone("US/Eastern"))
     assert normalize_to_midnight(start) == expected
+
+
+def test_week_to_mask_all_true():
+    assert week_to_mask(week_range_all_true()) == 2**(7 * 24) - 1
+
+
+def test_week_to_mask_matches_hours_to_mask():
+    week = week_range_all_true()
+    for day in week_day_range():
+        week[day] = [0] * 24
+    week["tuesday"][7:11] = [1] * 4
+    week["sunday"][23] = 1
+
+    expected = hours_to_mask("tuesday", 7, 11) | hours_to_mask("sunday", 23,
+                                                               24)
+    assert week_to_mask(week) == expected
@@ -0,0 +1,115 @@
+"""
+Test the Incidence arrays against the datetime logic they replace
+"""
+
+import unittest
+from datetime import timedelta
+
+import numpy as np
+
+from mobius import Environment, Employee
+from mobius.incidence import Incidence
+from mobius.helpers import dt_to_day, dt_overlaps, week_day_range, \
+    week_range_all_true
+from mobius.shift import Shift
+
+
+class TestIncidence(unittest.TestCase):
+    def setUp(self):
+        self.env = Environment(organization_id=7,
+                               location_id=8,
+                               role_id=4,
+                               schedule_id=9,
+                               tz_string="America/Los_Angeles",
+                               start="2015-12-21T08:00:00",
+                               stop="2015-12-28T08:00:00",
+                               day_week_starts="monday",
+                               min_minutes_per_workday=60 * 5,
+                               max_minutes_per_workday=60 * 8,
+                               min_minutes_between_shifts=60 * 12,
+                               max_consecutive_workdays=6, )
+
+        # Start/stop tuples
+        start_stops = [
+            ("2015-12-21T08:00:00", "2015-12-21T13:00:00"),
+            ("2015-12-21T16:00:00", "2015-12-22T01:30:00"),
+            ("2015-12-22T06:00:00", "2015-12-22T10:00:00"),
+            ("2015-12-24T10:15:00", "2015-12-24T16:45:00"),
+            ("2015-12-27T20:00:00", "2015-12-28T04:00:00"),
+            ("2015-12-28T04:00:00", "2015-12-28T12:00:00"),
+        ]
+        self.shifts = []
+        for shift_id, (start, stop) in enumerate(start_stops):
+            self.shifts.append(Shift({
+                "id": shift_id,
+                "user_id": 0,
+                "start": start,
+                "stop": stop,
+            }))
+
+        self.incidence = Incidence(self.env, [], self.shifts)
+
+    def test_minutes(self):
+        for i, s in enumerate(self.shifts):
+            assert self.incidence.minutes[i] == s.total_minutes()
+
+    def test_day(self):
+        for d, day in enumerate(self.incidence.days):
+            expected = []
+            for i, s in enumerate(self.shifts):
+                start = self.env.datetime_utc_to_local(s.start)
+                stop = self.env.datetime_utc_to_local(s.stop)
+                if dt_to_day(start) == day or (dt_to_day(stop) == day and
+                                               s.stop <= self.env.stop):
+                    expected.append(i)
+
+            assert np.flatnonzero(self.incidence.day[:, d]).tolist(
+            ) == expected
+
+    def test_workday_minutes(self):
+        assert self.incidence.workday_minutes.shape == (len(self.shifts), 7)
+
+        for workday in range(7):
+            workday_start = self.env.start + timedelta(days=workday)
+            workday_stop = workday_start + timedelta(days=1)
+
+            for i, s in enumerate(self.shifts):
+                if dt_overlaps(s.start, s.stop, workday_start, workday_stop):
+                    expected = s.minutes_overlap(start=workday_start,
+                                                 stop=workday_stop)
+                else:
+                    expected = 0
+                assert self.incidence.workday_minutes[i, workday] == expected
+
+    def test_available_matches_available_to_work(self):
+        employees = []
+        for user_id in range(4):
+            working_hours = week_range_all_true()
+            for d, day in enumerate(week_day_range()):
+                # A different pattern per employee and day
+                working_hours[day] = [int((hour + d + user_id) %
+                                          (user_id + 2) != 0)
+                                      for hour in range(24)]
+            employees.append(Employee(user_id=user_id,
+                                      min_hours_per_workweek=0,
+                                      max_hours_per_workweek=40,
+                                      preferences=week_range_all_true(),
+                                      working_hours=working_hours,
+                                      time_off_requests=[],
+                                      preceding_day_worked=False,
+                                      preceding_days_worked_streak=0,
+                                      existing_shifts=[],
+                                      environment=self.env))
+
+        # Only available all of the time
+        employees[0].availability = week_range_all_true()
+        # .. except next to an existing shift
+        employees[0].existing_shifts = [self.shifts[2]]
+
+        incidence = Incidence(self.env, employees, self.shifts)
+        for i, e in enumerate(employees):
+            for j, s in enumerate(self.shifts):
+                assert incidence.available[i, j] == e.available_to_work(s)
+
+        assert incidence.available.any()
+        assert not incidence.available.all()
@@ -0,0 +1,183 @@
+"""
+Test loading a role's employees from one batch of api calls
+"""
+
+import unittest
+
+from mobius import Environment, Employee
+from mobius.loader import RoleLoader
+from mobius.shift import Shift
+from mobius.helpers import week_range_all_true
+
+from tests.helpers import ApiSpoof
+
+
+class RoleSpoof:
+    """Role that counts api calls"""
+
+    def __init__(self, workers, shifts):
+        self.workers = workers
+        self.shifts = shifts
+        self.calls = 0
+
+    def get_workers(self, **kwargs):
+        self.calls += 1
+        return [ApiSpoof(w) for w in self.workers]
+
+    def get_shifts(self, **kwargs):
+        self.calls += 1
+        return self.shifts
+
+
+class ScheduleSpoof:
+    """Schedule that counts api calls"""
+
+    def __init__(self, preferences, time_off_requests):
+        self.preferences = preferences
+        self.time_off_requests = time_off_requests
+        self.calls = 0
+
+    def get_preferences(self, **kwargs):
+        self.calls += 1
+        return [ApiSpoof(p) for p in self.preferences]
+
+    def get_schedule_time_off_requests(self, **kwargs):
+        self.calls += 1
+        return [ApiSpoof(r) for r in self.time_off_requests]
+
+
+class TestRoleLoader(unittest.TestCase):
+    def setUp(self):
+        self.env = Environment(organization_id=7,
+                               location_id=8,
+                               role_id=4,
+                               schedule_id=9,
+                               tz_string="America/Los_Angeles",
+                               start="2015-12-21T08:00:00",
+                               stop="2015-12-28T08:00:00",
+                               day_week_starts="monday",
+                               min_minutes_per_workday=60 * 5,
+                               max_minutes_per_workday=60 * 8,
+                               min_minutes_between_shifts=60 * 12,
+                               max_consecutive_workdays=3, )
+
+        def worker(user_id):
+            return {
+                "id": user_id,
+                "min_hours_per_workweek": 20,
+                "max_hours_per_workweek": 40,
+                "working_hours": week_range_all_true(),
+            }
+
+        self.preference = week_range_all_true()
+        self.preference["monday"] = [0] * 24
+
+        self.role = RoleSpoof(workers=[worker(1), worker(2), worker(3)],
+                              shifts=[
+                                  # User 1 worked the two days before the week
+                                  {"id": 10,
+                                   "user_id": 1,
+                                   "start": "2015-12-19T10:00:00",
+                                   "stop": "2015-12-19T18:00:00"},
+                                  {"id": 11,
+                                   "user_id": 1,
+                                   "start": "2015-12-20T10:00:00",
+                                   "stop": "2015-12-20T18:00:00"},
+                                  # User 2 only has an existing shift this week
+                                  {"id": 12,
+                                   "user_id": 2,
+                                   "start": "2015-12-22T10:00:00",
+                                   "stop": "2015-12-22T15:00:00"},
+                                  # User 3 works past midnight into the week
+                                  {"id": 14,
+                                   "user_id": 3,
+                                   "start": "2015-12-21T04:00:00",
+                                   "stop": "2015-12-21T10:00:00"},
+                                  # Unassigned shifts belong to nobody
+                                  {"id": 13,
+                                   "user_id": 0,
+                                   "start": "2015-12-23T10:00:00",
+                                   "stop": "2015-12-23T15:00:00"},
+                              ])
+        self.schedule = ScheduleSpoof(
+            preferences=[{"user_id": 3,
+                          "preference": self.preference}],
+            time_off_requests=[{"user_id": 3,
+                                "state": "approved_paid",
+                                "minutes_paid": 8 * 60,
+                                "start": "2015-12-23T08:00:00"}])
+
+        self.employees = RoleLoader(self.role, self.schedule,
+                                    self.env).load_employees()
+
+    def test_constant_api_calls(self):
+        assert self.role.calls == 2
+        assert self.schedule.calls == 2
+
+    def test_history(self):
+        one, two, three = self.employees
+
+        assert one.preceding_day_worked is True
+        assert one.preceding_days_worked_streak == 2
+        assert one.existing_shifts == []
+
+        assert two.preceding_day_worked is False
+        assert two.preceding_days_worked_streak == 0
+        assert [s.shift_id for s in two.existing_shifts] == [12]
+        assert two.min_hours_per_workweek == 15
+        assert two.max_hours_per_workweek == 35
+
+        assert three.existing_shifts == []
+        assert three.preceding_day_worked is True
+        assert three.active_days["monday"] is True
+        assert one.active_days["monday"] is False
+
+    def test_preferences_and_time_off(self):
+        one, two, three = self.employees
+
+        assert one.min_hours_per_workweek == 20
+        assert sum(one.preferences["monday"]) == 24
+
+        assert sum(three.preferences["monday"]) == 0
+        assert three.min_hours_per_workweek == 12
+        assert three.max_hours_per_workweek == 32
+        assert sum(three.availability["wednesday"]) == 0
+
+    def test_employee_fetches_history_once(self):
+        role = RoleSpoof(workers=[], shifts=self.role.shifts[:2])
+        e = Employee(user_id=1,
+                     min_hours_per_workweek=20,
+                     max_hours_per_workweek=40,
+                     preferences=week_range_all_true(),
+                     working_hours=week_range_all_true(),
+                     time_off_requests=[],
+                     environment=self.env,
+                     role=role)
+
+        assert role.calls == 1
+        assert e.preceding_day_worked is True
+        assert e.preceding_days_worked_streak == 2
+        assert e.existing_shifts == []
+
+    def test_shifts_from_other_roles(self):
+        loader = RoleLoader(self.role, self.schedule, self.env)
+        loader.fetch()
+        loader.add_shifts([
+            # Another role's shift this week
+            Shift({"id": 20,
+                   "user_id": 2,
+                   "start": "2015-12-24T10:00:00",
+                   "stop": "2015-12-24T15:00:00"}),
+            # Already fetched, and unassigned
+            Shift(self.role.shifts[2]),
+            Shift({"id": 21,
+                   "user_id": 0,
+                   "start": "2015-12-24T10:00:00",
+                   "stop": "2015-12-24T15:00:00"}),
+        ])
+        one, two, three = loader.build_employees()
+
+        assert sorted(s.shift_id for s in two.existing_shifts) == [12, 20]
+        assert two.min_hours_per_workweek == 10
+        assert two.max_hours_per_workweek == 30
+        assert one.existing_shifts == []
@@ -0,0 +1,97 @@
+"""
+Test task metrics and their Prometheus rendering
+"""
+
+import unittest
+
+try:
+    from urllib.request import urlopen
+except ImportError:
+    from urllib2 import urlopen
+
+from mobius import Assign, Environment, Employee
+from mobius.helpers import week_range_all_true
+from mobius.metrics import Metrics, Registry, start_metrics_server
+from mobius.shift import Shift
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_timer_accumulates(self):
+        metrics = Metrics(schedule_id=9)
+        with metrics.timer("fetch"):
+            pass
+        first = metrics.timings["fetch"]
+        with metrics.timer("fetch"):
+            pass
+
+        assert metrics.timings["fetch"] >= first
+        assert metrics.as_dict()["schedule_id"] == 9
+
+    def test_render(self):
+        for success in [True, True, False]:
+            metrics = Metrics()
+            with metrics.timer("solve"):
+                pass
+            metrics.set("stage", "soft")
+            metrics.set("variables", 12)
+            metrics.finish(success, registry=self.registry)
+
+        text = self.registry.render()
+        assert 'mobius_tasks_total{result="success"} 2' in text
+        assert 'mobius_tasks_total{result="failure"} 1' in text
+        assert 'mobius_phase_seconds_count{phase="solve"} 3' in text
+        assert 'mobius_stage_total{stage="soft"} 3' in text
+        assert "mobius_last_variables 12" in text
+
+    def test_server(self):
+        server = start_metrics_server(0, lambda: "mobius_up 1\n")
+        try:
+            body = urlopen("http://127.0.0.1:%s/metrics" %
+                           server.server_address[1]).read()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        assert body.decode("utf-8") == "mobius_up 1\n"
+
+    def test_assign_model_metrics(self):
+        env = Environment(organization_id=7,
+                          location_id=8,
+                          role_id=4,
+                          schedule_id=9,
+                          tz_string="America/Los_Angeles",
+                          start="2015-12-21T08:00:00",
+                          stop="2015-12-28T08:00:00",
+                          day_week_starts="monday",
+                          min_minutes_per_workday=60 * 5,
+                          max_minutes_per_workday=60 * 8,
+                          min_minutes_between_shifts=60 * 12,
+                          max_consecutive_workdays=6, )
+        employees = [Employee(user_id=user_id,
+                              min_hours_per_workweek=0,
+                              max_hours_per_workweek=40,
+                              preferences=week_range_all_true(),
+                              working_hours=week_range_all_true(),
+                              time_off_requests=[],
+                              preceding_day_worked=False,
+                              preceding_days_worked_streak=0,
+                              existing_shifts=[],
+                              environment=env) for user_id in [1, 2]]
+        shifts = [Shift({"id": 1,
+                         "user_id": 0,
+                         "start": "2015-12-21T16:00:00",
+                         "stop": "2015-12-21T22:00:00"})]
+
+        metrics = Metrics()
+        a = Assign(env, employees, shifts, solver="cbc", metrics=metrics)
+        a._build_model()
+
+        for family in ["coverage", "transitions", "consecutive_days_off",
+                       "week", "workday"]:
+            assert "build_%s" % family in metrics.timings
+        assert metrics.values["variables"] > 0
+        assert metrics.values["constraints"] > 0
+        assert metrics.values["nonzeros"] >= metrics.values["constraints"]
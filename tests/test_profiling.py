@@ -0,0 +1,62 @@
+"""
+Test the model build profiler
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from mobius.profiling import BuildProfiler
+
+
+def busy(n):
+    return sum(i * i for i in range(n))
+
+
+class TestBuildProfiler(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_disabled(self):
+        profiler = BuildProfiler()
+        with profiler.section("coverage"):
+            busy(1000)
+
+        assert profiler.profiles == {}
+        assert profiler.dump(self.directory, "none") == []
+
+    def test_sections(self):
+        profiler = BuildProfiler(enabled=True)
+        with profiler.section("coverage"):
+            busy(20000)
+        with profiler.section("week"):
+            busy(20000)
+        with profiler.section("coverage"):
+            busy(20000)
+
+        assert list(profiler.profiles.keys()) == ["coverage", "week"]
+
+        sections = set()
+        for line in profiler.folded():
+            stack, microseconds = line.rsplit(" ", 1)
+            assert int(microseconds) > 0
+            sections.add(stack.split(";")[0])
+        assert sections == set(["coverage", "week"])
+        assert "coverage" in profiler.summary()
+
+    def test_dump(self):
+        profiler = BuildProfiler(enabled=True)
+        with profiler.section("workday"):
+            busy(20000)
+
+        paths = profiler.dump(
+            os.path.join(self.directory, "profiles"), "mobius-test-role-4-9")
+        assert [os.path.basename(p) for p in paths] == [
+            "mobius-test-role-4-9.folded", "mobius-test-role-4-9.prof"
+        ]
+        for path in paths:
+            assert os.path.getsize(path) > 0
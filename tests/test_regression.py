@@ -0,0 +1,116 @@
+"""
+Test comparing benchmark runs against a baseline
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from mobius import config
+from mobius.benchmark import Scenario, regression
+
+
+def report(build_seconds, solve_seconds, variables):
+    return {
+        "meta": {"solver": "cbc",
+                 "solve": True,
+                 "repeat": len(build_seconds),
+                 "time_limit": 10},
+        "results": [{
+            "scenario": Scenario(employees=2, shifts=4).name(),
+            "params": {"employees": 2,
+                       "shifts": 4},
+            "build_seconds": build_seconds,
+            "solve_seconds": solve_seconds,
+            "variables": variables,
+            "constraints": variables,
+        }]
+    }
+
+
+class TestRegression(unittest.TestCase):
+    def regressed(self, baseline, current):
+        return dict((row[1], row[-1])
+                    for row in regression.compare(baseline, current))
+
+    def test_iqr(self):
+        assert regression.iqr([1, 2, 3, 4, 5]) == 2
+        assert regression.iqr([7]) == 0
+        assert regression.iqr([4, 1, 3, 2]) == 1.5
+
+    def test_unchanged_passes(self):
+        baseline = report([1.0, 1.1, 0.9], [2.0, 2.1, 1.9], 100)
+        assert not any(self.regressed(baseline, baseline).values())
+
+    def test_slower_build_fails(self):
+        baseline = report([1.0, 1.1, 0.9], [2.0, 2.1, 1.9], 100)
+        current = report([2.0, 2.1, 1.9], [2.0, 2.1, 1.9], 100)
+        regressed = self.regressed(baseline, current)
+        assert regressed["build_seconds"]
+        assert not regressed["solve_seconds"]
+
+    def test_noisy_timings_pass(self):
+        # The median doubled, but within the spread of the samples
+        baseline = report([1.0, 0.2, 3.0], [2.0, 2.1, 1.9], 100)
+        current = report([2.0, 0.4, 3.5], [2.0, 2.1, 1.9], 100)
+        assert not self.regressed(baseline, current)["build_seconds"]
+
+    def test_tiny_timings_pass(self):
+        baseline = report([0.01, 0.01, 0.01], [0.01, 0.01, 0.01], 100)
+        current = report([0.03, 0.03, 0.03], [0.03, 0.03, 0.03], 100)
+        assert not any(self.regressed(baseline, current).values())
+
+    def test_more_variables_fails(self):
+        baseline = report([1.0], [2.0], 100)
+        assert not self.regressed(
+            baseline, report([1.0], [2.0], 104))["variables"]
+        assert self.regressed(baseline, report([1.0], [2.0], 110))["variables"]
+
+    def test_rerun_uses_baseline_threads(self):
+        baseline = report([1.0], [2.0], 100)
+        baseline["meta"]["threads"] = config.THREADS + 1
+        threads = []
+
+        def run(scenarios, **settings):
+            threads.append(config.THREADS)
+            return report([1.0], [2.0], 100)
+
+        previous_threads = config.THREADS
+        previous_run = regression.run
+        regression.run = run
+        try:
+            regression.rerun(baseline)
+        finally:
+            regression.run = previous_run
+
+        assert threads == [previous_threads + 1]
+        assert config.THREADS == previous_threads
+
+    def test_check_and_update(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "baseline.json")
+            with open(path, "w") as f:
+                json.dump(report([100.0, 100.0], [100.0, 100.0], 10**6), f)
+            # Far faster and smaller than the baseline
+            assert regression.main(["--baseline", path]) == 0
+
+            with open(path, "w") as f:
+                json.dump(report([0.0, 0.0], [0.0, 0.0], 1), f)
+            assert regression.main(["--baseline", path]) == 1
+
+            # Nothing to compare against
+            stale = report([0.0, 0.0], [0.0, 0.0], 1)
+            stale["results"][0]["scenario"] = "e2-s4-o0.5-a0.8"
+            with open(path, "w") as f:
+                json.dump(stale, f)
+            assert regression.main(["--baseline", path]) == 1
+
+            assert regression.main(["--baseline", path, "--update", "--grid",
+                                    "tiny", "--repeat", "1"]) == 0
+            with open(path) as f:
+                assert len(json.load(f)["results"]) == 2
+        finally:
+            shutil.rmtree(directory)
@@ -0,0 +1,60 @@
+"""
+Test the Shift object
+"""
+
+import unittest
+
+from mobius import Environment
+from mobius.shift import Shift
+
+
+class TestShift(unittest.TestCase):
+    def setUp(self):
+        self.env_attributes = {
+            "organization_id": 7,
+            "location_id": 8,
+            "role_id": 4,
+            "schedule_id": 9,
+            "tz_string": "America/Los_Angeles",
+            "start": "2015-12-21T08:00:00",
+            "stop": "2015-12-28T08:00:00",
+            "day_week_starts": "monday",
+            "min_minutes_per_workday": 60 * 5,
+            "max_minutes_per_workday": 60 * 8,
+            "min_minutes_between_shifts": 60 * 12,
+            "max_consecutive_workdays": 6,
+        }
+        self.env = Environment(**self.env_attributes)
+
+    def create_shift(self, start, stop):
+        return Shift({"id": 2718, "user_id": 0, "start": start, "stop": stop})
+
+    def test_local_times(self):
+        s = self.create_shift("2015-12-22T15:00:00", "2015-12-23T10:30:00")
+        local = s.local(self.env)
+
+        assert local.start_day == "tuesday"
+        assert local.stop_day == "wednesday"
+        assert local.start_hour == 7
+        assert local.stop_hour == 2
+        # Partial hour is searched
+        assert local.search_stop_hour == 3
+        assert local.search_stop_day == "wednesday"
+        assert local.total_minutes == 19 * 60 + 30
+
+    def test_local_times_ending_at_midnight(self):
+        s = self.create_shift("2015-12-22T15:00:00", "2015-12-23T08:00:00")
+        local = s.local(self.env)
+
+        assert local.stop_day == "wednesday"
+        assert local.search_stop_hour == 0
+        assert local.search_stop_day == "tuesday"
+
+    def test_local_times_cached_per_environment(self):
+        s = self.create_shift("2015-12-22T15:00:00", "2015-12-23T08:00:00")
+        assert s.local(self.env) is s.local(self.env)
+
+        self.env_attributes["tz_string"] = "UTC"
+        utc_env = Environment(**self.env_attributes)
+        assert s.local(utc_env).start_hour == 15
+        assert s.local(utc_env) is not s.local(self.env)
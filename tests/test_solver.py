@@ -0,0 +1,103 @@
+"""
+Test the open-source solver backend
+"""
+
+import pytest
+
+from mobius.solver import get_solver, BINARY, LESS_EQUAL, GREATER_EQUAL
+
+
+def test_unknown_solver_raises():
+    with pytest.raises(Exception):
+        get_solver("test-model", solver="simplex-by-hand")
+
+
+def test_cbc_solves_small_model():
+    m = get_solver("test-model", solver="cbc")
+    x = m.add_var("x", vtype=BINARY)
+    y = m.add_var("y", vtype=BINARY)
+    z = m.add_var("z", vtype=BINARY)
+
+    m.add_constr(m.quicksum([x, y, z]), LESS_EQUAL, 2)
+    m.add_constr(x + z, LESS_EQUAL, 1)
+    m.add_constr(y, GREATER_EQUAL, 0)
+
+    obj = m.expression()
+    obj += 3 * x + 2 * y + 4 * z
+    m.set_objective(obj, maximize=True)
+    m.update()
+
+    assert m.optimize()
+    assert m.objective_value() == 6
+    assert m.value(x) < .5
+    assert m.value(y) > .5
+    assert m.value(z) > .5
+
+
+def test_cbc_bounds_and_warm_start():
+    m = get_solver("test-model", solver="cbc")
+    x = m.add_var("x", vtype=BINARY)
+    y = m.add_var("y", vtype=BINARY)
+    relaxation = m.add_var("relaxation", vtype=BINARY)
+
+    m.add_constr(x + y, LESS_EQUAL, 1)
+    # Require x unless relaxed
+    m.add_constr(x + relaxation, GREATER_EQUAL, 1)
+    m.set_objective(x + 2 * y, maximize=True)
+
+    # Strict - x must be picked
+    m.set_bounds(relaxation, 0, 0)
+    assert m.optimize()
+    assert m.value(x) > .5
+
+    # Relaxed, starting from the strict solution - y is better
+    assert m.warm_start()
+    m.set_bounds(relaxation, 0, 1)
+    assert m.optimize()
+    assert m.value(y) > .5
+    assert m.objective_value() == 2
+
+
+def test_cbc_stopped_at_time_limit_is_not_optimal():
+    m = get_solver("test-model", solver="cbc")
+    x = m.add_var("x", vtype=BINARY)
+    m.set_objective(x + 0, maximize=True)
+    m.set_time_limit(1)
+
+    # CBC reports "optimal" for any integer solution when it stops at the
+    # time limit - only the solution status tells them apart
+    def solve(solver):
+        assert solver.timeLimit == 1
+        m.model.status = m.pulp.LpStatusOptimal
+        m.model.sol_status = m.pulp.LpSolutionIntegerFeasible
+
+    m.model.solve = solve
+
+    assert not m.optimize()
+    assert m.has_solution()
+
+
+def test_cbc_older_pulp_arguments(monkeypatch):
+    m = get_solver("test-model", solver="cbc")
+    x = m.add_var("x", vtype=BINARY)
+    m.set_objective(x + 0, maximize=True)
+    m.set_time_limit(1)
+    m.use_warm_start = True
+
+    # PuLP 2.0 takes maxSeconds and mip_start, and has no solution status
+    class PULP_CBC_CMD(object):
+        def __init__(self, msg, threads, maxSeconds, mip_start):
+            self.maxSeconds = maxSeconds
+            self.mip_start = mip_start
+
+    def solve(solver):
+        assert solver.maxSeconds == 1
+        assert solver.mip_start
+        m.model.status = m.pulp.LpStatusOptimal
+
+    monkeypatch.setattr(m.pulp, "PULP_CBC_CMD", PULP_CBC_CMD)
+    m.model.solve = solve
+    del m.model.sol_status
+
+    assert m.optimize()
+    assert m.has_solution()
@@ -0,0 +1,69 @@
+"""
+Test the pieces of the multi-worker supervisor
+"""
+
+import multiprocessing
+import time
+import unittest
+
+from mobius import Tasking
+from mobius.metrics import Metrics, QueueRegistry, Registry
+from mobius.supervisor import threads_per_worker, WorkerHealth
+
+
+def finish_task(registry):
+    """Finish a task's metrics in a worker process"""
+    metrics = Metrics(schedule_id=9)
+    metrics.set("stage", "soft")
+    metrics.add_time("solve", 1.5)
+    metrics.finish(True, registry)
+
+
+class TestSupervisor(unittest.TestCase):
+    def test_threads_per_worker(self):
+        assert threads_per_worker(1, 16) == 16
+        assert threads_per_worker(4, 16) == 4
+        assert threads_per_worker(3, 16) == 5
+        assert threads_per_worker(32, 16) == 1
+
+    def test_health(self):
+        health = WorkerHealth()
+        assert health.report()["state"] == "idle"
+
+        health.beat(working=True)
+        assert health.report()["state"] == "working"
+
+        health.task_done(True)
+        health.task_done(False)
+        report = health.report()
+        assert report["state"] == "idle"
+        assert report["completed"] == 1
+        assert report["failed"] == 1
+
+    def test_stopped_tasking_returns(self):
+        stop_event = multiprocessing.Event()
+        stop_event.set()
+        health = WorkerHealth()
+
+        # Returns without claiming a task
+        Tasking(stop_event=stop_event, health=health).server()
+        assert health.report()["completed"] == 0
+
+    def test_worker_metrics_reach_supervisor(self):
+        registry = Registry()
+        queue_registry = QueueRegistry()
+        queue_registry.forward(registry)
+
+        worker = multiprocessing.Process(target=finish_task,
+                                         args=(queue_registry, ))
+        worker.start()
+        worker.join(30)
+
+        deadline = time.time() + 30
+        while not registry.tasks and time.time() < deadline:
+            time.sleep(0.01)
+
+        text = registry.render()
+        assert 'mobius_tasks_total{result="success"} 1' in text
+        assert 'mobius_phase_seconds_sum{phase="solve"} 1.5' in text
+        assert 'mobius_stage_total{stage="soft"} 1' in text
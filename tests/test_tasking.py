@@ -0,0 +1,298 @@
+"""
+Test how the tasking server polls for tasks
+"""
+
+from collections import OrderedDict
+import multiprocessing
+import unittest
+
+from staffjoy.exceptions import NotFoundException
+
+from mobius import Tasking, config
+from mobius import client, tasking
+
+
+class EmptyQueueClient:
+    """Client whose queue is always empty, or always erroring"""
+
+    def __init__(self, error):
+        self.error = error
+        self.claims = 0
+
+    def claim_mobius_task(self):
+        self.claims += 1
+        raise self.error
+
+
+class FailingTaskClient:
+    """Client that hands out tasks that fail"""
+
+    def __init__(self, tasks):
+        self.tasks = tasks
+
+    def claim_mobius_task(self):
+        return self.tasks.pop(0)
+
+
+class QueueClient:
+    """Client that hands out tasks until the queue is empty"""
+
+    def __init__(self, tasks):
+        self.tasks = tasks
+        self.claims = 0
+
+    def claim_mobius_task(self):
+        self.claims += 1
+        if not self.tasks:
+            raise NotFoundException()
+        return self.tasks.pop(0)
+
+
+class TaskSpoof:
+    def __init__(self, schedule_id, location_id=None, week=None):
+        self.data = {"schedule_id": schedule_id,
+                     "organization_id": 1,
+                     "location_id": location_id}
+        self.week = week  # Start of the schedule
+        self.deleted = False
+
+    def delete(self):
+        self.deleted = True
+
+
+class ScheduleSpoof:
+    def __init__(self, start=None):
+        self.data = {"start": start}
+        self.states = []
+
+    def patch(self, state=None):
+        self.states.append(state)
+
+
+class TestTasking(unittest.TestCase):
+    def poll(self, error, polls):
+        """Run the server for a number of polls and return the waits"""
+        stop_event = multiprocessing.Event()
+        waits = []
+
+        def wait(seconds):
+            waits.append(seconds)
+            if len(waits) == polls:
+                stop_event.set()
+
+        t = Tasking(stop_event=stop_event, wait_for_task=wait)
+        t.client = EmptyQueueClient(error)
+        t._sleep = wait
+        t.server()
+
+        assert t.client.claims == polls
+        return waits
+
+    def test_empty_queue_backs_off(self):
+        waits = self.poll(NotFoundException(), 8)
+
+        assert waits[0] <= config.TASKING_MIN_FETCH_INTERVAL_SECONDS
+        assert max(waits) <= config.TASKING_FETCH_INTERVAL_SECONDS
+        assert waits[-1] >= config.TASKING_FETCH_INTERVAL_SECONDS / 2.0
+
+    def test_errors_back_off_further(self):
+        waits = self.poll(Exception("api down"), 10)
+
+        assert max(waits) <= config.TASKING_MAX_ERROR_INTERVAL_SECONDS
+        assert waits[-1] > config.TASKING_FETCH_INTERVAL_SECONDS
+
+    def fail_tasks(self, failures, kill_on_error):
+        """Run the server through failing tasks and return what it did"""
+        stop_event = multiprocessing.Event()
+        restarts = []
+
+        t = Tasking(stop_event=stop_event)
+        t.sched = ScheduleSpoof()
+
+        def process_task(task, metrics):
+            stop_event.set()
+            raise Exception("Solver connection drained")
+
+        t._process_task = process_task
+        t._restart = lambda: restarts.append(t.consecutive_failures)
+        t.sleeps = []
+        t._sleep = t.sleeps.append
+
+        previous_kill_on_error = config.KILL_ON_ERROR
+        config.KILL_ON_ERROR = kill_on_error
+        try:
+            # Recovery swaps the client, so one task per run
+            for i in range(failures):
+                stop_event.clear()
+                t.client = FailingTaskClient([TaskSpoof(i)])
+                t.server()
+        finally:
+            config.KILL_ON_ERROR = previous_kill_on_error
+
+        return t, restarts
+
+    def test_failure_recovers_in_process(self):
+        before = client.get_client()
+        t, restarts = self.fail_tasks(2, kill_on_error=True)
+
+        assert restarts == []
+        assert t.sched.states == [Tasking.REQUEUE_STATE] * 2
+        assert t.consecutive_failures == 2
+        # Fresh api client
+        assert client.get_client() is not before
+
+    def test_repeated_failures_restart(self):
+        n = config.RECOVERY_MAX_CONSECUTIVE_FAILURES
+        t, restarts = self.fail_tasks(n, kill_on_error=True)
+        assert restarts == [n]
+
+    def test_no_restart_without_kill_on_error(self):
+        n = config.RECOVERY_MAX_CONSECUTIVE_FAILURES
+        t, restarts = self.fail_tasks(n, kill_on_error=False)
+        assert restarts == []
+
+    def test_failures_back_off(self):
+        t, restarts = self.fail_tasks(4, kill_on_error=False)
+
+        # A wait after every failed task, longer each time
+        assert len(t.sleeps) == 4
+        assert t.sleeps[0] <= config.TASKING_MIN_FETCH_INTERVAL_SECONDS
+        assert t.sleeps == sorted(t.sleeps)
+        assert t.sleeps[-1] > config.TASKING_MIN_FETCH_INTERVAL_SECONDS
+
+    def run_batch(self, tasks, fail=(), stop_after=None):
+        """Claim and process batches until the queue is empty, returning
+        the schedule ids processed with the LocationBatch each saw"""
+        stop_event = multiprocessing.Event()
+        processed = []
+
+        # Stop once the queue is empty
+        t = Tasking(stop_event=stop_event,
+                    wait_for_task=lambda seconds: stop_event.set())
+        t.client = QueueClient(list(tasks))
+        t.sched = ScheduleSpoof()
+        t._recover = lambda: processed.append("recovered")
+        t.sleeps = []
+        t._sleep = t.sleeps.append
+
+        t.fetched = OrderedDict()  # {schedule_id: ScheduleSpoof}
+        t.patched = []
+
+        def fetch_schedule(task):
+            schedule = ScheduleSpoof(task.week)
+            t.fetched[task.data["schedule_id"]] = schedule
+            t.schedules[task.data["schedule_id"]] = schedule
+
+        def patch(resource_obj, **kwargs):
+            t.patched.append((resource_obj._url(), kwargs))
+
+        def process_task(task, metrics):
+            processed.append((task.data["schedule_id"], t.batch))
+            if task.data["schedule_id"] == stop_after:
+                stop_event.set()
+            if task.data["schedule_id"] in fail:
+                raise Exception("Infeasible")
+
+        t._fetch_schedule = fetch_schedule
+        t._process_task = process_task
+
+        previous = (config.TASKING_BATCH_SIZE, tasking.patch)
+        config.TASKING_BATCH_SIZE = 3
+        tasking.patch = patch
+        try:
+            t.server()
+        finally:
+            config.TASKING_BATCH_SIZE, tasking.patch = previous
+
+        return t, processed
+
+    def test_batch_shares_location_objects(self):
+        tasks = [TaskSpoof(i, location_id=10) for i in range(1, 5)]
+        t, processed = self.run_batch(tasks)
+
+        # Up to the batch size together. The last task is in the next batch.
+        assert [p[0] for p in processed] == [1, 2, 3, 4]
+        assert processed[0][1] is processed[1][1] is processed[2][1]
+        assert processed[3][1] is not processed[0][1]
+        assert all(task.deleted for task in tasks)
+
+    def test_batch_ends_at_another_location(self):
+        tasks = [TaskSpoof(1, location_id=10), TaskSpoof(2, location_id=20),
+                 TaskSpoof(3, location_id=10), TaskSpoof(4, location_id=10)]
+        t, processed = self.run_batch(tasks)
+
+        # The other location's task goes back to the queue for another
+        # worker, without fetching its schedule
+        assert [p[0] for p in processed] == [1, 3, 4]
+        assert processed[1][1] is processed[2][1]
+        assert processed[0][1] is not processed[1][1]
+        assert [url.rsplit("/", 1)[1] for url, _ in t.patched] == ["2"]
+        assert list(t.fetched) == [1, 3, 4]
+        assert not tasks[1].deleted
+
+    def test_batch_ends_at_another_week(self):
+        tasks = [
+            TaskSpoof(1, location_id=10, week="2016-05-02"),
+            TaskSpoof(2, location_id=10, week="2016-05-09"),
+            TaskSpoof(3, location_id=10, week="2016-05-02")
+        ]
+        t, processed = self.run_batch(tasks)
+
+        assert [p[0] for p in processed] == [1, 3]
+        assert processed[0][1] is not processed[1][1]
+        assert not tasks[1].deleted
+        # Requeued with the schedule fetched while claiming
+        assert list(t.fetched) == [1, 2, 3]
+        assert t.fetched[2].states == [Tasking.REQUEUE_STATE]
+        assert t.patched == []
+
+    def test_batch_size_one_fetches_nothing_while_claiming(self):
+        previous = config.TASKING_BATCH_SIZE
+        t = Tasking()
+        t.client = QueueClient([TaskSpoof(1)])
+        t._fetch_schedule = lambda task: self.fail("Fetched a schedule")
+        try:
+            config.TASKING_BATCH_SIZE = 1
+            assert len(t._claim_tasks()) == 1
+        finally:
+            config.TASKING_BATCH_SIZE = previous
+        assert t.client.claims == 1
+
+    def test_batch_stops_claiming_on_empty_queue(self):
+        t, processed = self.run_batch([TaskSpoof(1)])
+
+        assert [p[0] for p in processed] == [1]
+        assert t.client.claims == 3  # Then polls the empty queue
+
+    def test_batch_failure_recovers_after_the_batch(self):
+        tasks = [TaskSpoof(1, location_id=10), TaskSpoof(2, location_id=10)]
+        t, processed = self.run_batch(tasks, fail=[1])
+
+        assert [p[0] if p != "recovered" else p
+                for p in processed] == [1, 2, "recovered"]
+        # Nothing shared from the failed task
+        assert processed[0][1] is not processed[1][1]
+        assert t.sched.states == [Tasking.REQUEUE_STATE]
+        assert not tasks[0].deleted and tasks[1].deleted
+        # Waits before claiming again
+        assert len(t.sleeps) == 1
+
+    def test_batch_success_resets_error_backoff(self):
+        # The first batch fails, the second succeeds
+        tasks = [TaskSpoof(i, location_id=10) for i in range(1, 5)]
+        t, processed = self.run_batch(tasks, fail=[1])
+
+        assert len(t.sleeps) == 1
+        assert t.error_backoff.attempts == 0
+
+    def test_batch_requeues_unstarted_tasks_when_stopping(self):
+        tasks = [TaskSpoof(i, location_id=10) for i in range(1, 4)]
+        t, processed = self.run_batch(tasks, stop_after=1)
+
+        # The task in hand finishes, the rest go back to the queue
+        assert [p[0] for p in processed] == [1]
+        assert tasks[0].deleted
+        assert not tasks[1].deleted and not tasks[2].deleted
+        assert [url.rsplit("/", 1)[1] for url, _ in t.patched] == ["2", "3"]
+        assert all(kwargs == {"state": Tasking.REQUEUE_STATE}
+                   for _, kwargs in t.patched)